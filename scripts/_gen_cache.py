@@ -0,0 +1,68 @@
+"""
+Run cache shared by the code generators in this directory.
+
+A generator records a digest of its inputs and of the files it wrote. A later
+run whose inputs hash the same, with the outputs untouched, can skip the work.
+This module's own source is part of every input digest, so changing the cache
+format invalidates existing cache files.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Iterable
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def inputs_digest(*blobs: bytes) -> str:
+    h = hashlib.sha256()
+    for b in (Path(__file__).read_bytes(), *blobs):
+        # Length-prefix each input so concatenation boundaries are unambiguous.
+        h.update(len(b).to_bytes(8, "little"))
+        h.update(b)
+    return h.hexdigest()
+
+
+def output_digests(root: Path, outputs: Iterable[Path]) -> dict[str, str] | None:
+    # Keyed by repo-relative path; None if any output is missing.
+    out: dict[str, str] = {}
+    for p in outputs:
+        try:
+            out[p.relative_to(root).as_posix()] = file_sha256(p)
+        except FileNotFoundError:
+            return None
+    return out
+
+
+def load_fresh_cache(
+    cache_file: Path, input_hash: str, root: Path, outputs: Iterable[Path]
+) -> dict | None:
+    """
+    Return the recorded cache if it was written for `input_hash` and the
+    outputs on disk still match it, else None.
+    """
+    try:
+        cache = json.loads(cache_file.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+    if not isinstance(cache, dict) or cache.get("input_hash") != input_hash:
+        return None
+    outputs = output_digests(root, outputs)
+    if outputs is None or cache.get("outputs") != outputs:
+        return None
+    return cache
+
+
+def cache_json(input_hash: str, root: Path, outputs: Iterable[Path], **extra: object) -> str:
+    # The cache file contents for a run that just wrote `outputs`.
+    cache = {"input_hash": input_hash, "outputs": output_digests(root, outputs), **extra}
+    return json.dumps(cache, indent=2, sort_keys=True) + "\n"
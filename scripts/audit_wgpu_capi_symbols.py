@@ -17,39 +17,84 @@
 Audit that our MoonBit C bindings cover the function symbols exposed by
 wgpu-native's C headers (webgpu.h + wgpu.h).
 
-We intentionally keep this lightweight (regex-based) so it runs anywhere without
-libclang.
+We intentionally keep this lightweight (plain string and regex scanning) so
+it runs anywhere without libclang.
 """
 
 from __future__ import annotations
 
 import argparse
+import mmap
+import os
 import re
 import sys
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Iterator
 
 
-_WGPU_FN_RE = re.compile(r"\b(wgpu[A-Za-z0-9_]+)\s*\(")
-_MBT_EXTERN_SYM_RE = re.compile(r'=\s*"(?P<sym>wgpu[A-Za-z0-9_]+)"')
+_IDENT_CHARS = frozenset(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_")
+_SPACE_CHARS = frozenset(b" \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f")
+# Bytes-mode so it runs over the mapped file directly.
+_MBT_EXTERN_SYM_RE = re.compile(rb'=\s*"(?P<sym>wgpu[A-Za-z0-9_]+)"')
 
 
-def _read_text(path: Path) -> str:
-    return path.read_text(encoding="utf-8", errors="ignore")
+@contextmanager
+def _map_file(path: Path) -> Iterator[bytes | mmap.mmap]:
+    # Scan the raw bytes: every symbol is ASCII, so only the matched slices
+    # need decoding, and the OS pages the file in as the scan advances.
+    with path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            yield m
+
+
+def _ident_end(buf: bytes | mmap.mmap, i: int) -> int:
+    n = len(buf)
+    while i < n and buf[i] in _IDENT_CHARS:
+        i += 1
+    return i
+
+
+def _scan_wgpu_calls(buf: bytes | mmap.mmap) -> set[str]:
+    # Equivalent to `\b(wgpu[A-Za-z0-9_]+)\s*\(`, but lets `find` skip over
+    # the (large) regions of the header that never mention `wgpu`.
+    out: set[str] = set()
+    n = len(buf)
+    i = 0
+    while True:
+        j = buf.find(b"wgpu", i)
+        if j == -1:
+            return out
+        if j > 0 and (buf[j - 1] in _IDENT_CHARS or buf[j - 1] >= 0x80):
+            # Inside a longer identifier; resume after it.
+            i = _ident_end(buf, j)
+            continue
+        k = _ident_end(buf, j + 4)
+        i = k
+        if k == j + 4:
+            continue
+        while k < n and buf[k] in _SPACE_CHARS:
+            k += 1
+        if k < n and buf[k] == 0x28:  # "("
+            out.add(buf[j:i].decode("ascii"))
 
 
 def extract_wgpu_symbols_from_headers(paths: list[Path]) -> set[str]:
     out: set[str] = set()
     for p in paths:
-        text = _read_text(p)
-        out.update(m.group(1) for m in _WGPU_FN_RE.finditer(text))
+        with _map_file(p) as buf:
+            out |= _scan_wgpu_calls(buf)
     return out
 
 
 def extract_wgpu_symbols_from_mbt(paths: list[Path]) -> set[str]:
     out: set[str] = set()
     for p in paths:
-        text = _read_text(p)
-        out.update(m.group("sym") for m in _MBT_EXTERN_SYM_RE.finditer(text))
+        with _map_file(p) as buf:
+            out.update(m.group("sym").decode("ascii") for m in _MBT_EXTERN_SYM_RE.finditer(buf))
     return out
 
 
@@ -11,13 +11,27 @@ Outputs:
 This generator focuses on completeness and type-checking:
 - `moon check` must stay green
 - the produced extern declarations are gradually refined into usable bindings
+
+Runs are skipped when neither the headers nor this script changed since the
+last generation and the outputs are intact (see CACHE_FILE); delete the cache
+file to force a rebuild.
 """
 
 from __future__ import annotations
 
+import hashlib
+import os
 import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from dataclasses import dataclass
+from functools import lru_cache
+from itertools import chain
 from pathlib import Path
+from typing import Callable, Iterator, NamedTuple
+
+from _gen_cache import cache_json, file_sha256, inputs_digest, load_fresh_cache
 
 
 REPO = Path(__file__).resolve().parents[1]
@@ -29,6 +43,9 @@ OUT_SPEC = REPO / "src/c/webgpu_capi_spec.mbt"
 OUT_IMPL = REPO / "src/c/webgpu_capi.mbt"
 OUT_CONSTS = REPO / "src/consts.mbt"
 OUT_TEST = REPO / "src/tests/wgpu_capi_symbols_test.mbt"
+OUTPUTS = (OUT_SPEC, OUT_IMPL, OUT_CONSTS, OUT_TEST)
+# Input/output digests of the last successful run.
+CACHE_FILE = REPO / "scripts/.gen_webgpu_capi_spec.cache.json"
 
 # License header for generated MoonBit files.
 LICENSE_HEADER = """// Copyright 2025 International Digital Economy Academy
@@ -45,6 +62,36 @@ LICENSE_HEADER = """// Copyright 2025 International Digital Economy Academy
 // See the License for the specific language governing permissions and
 // limitations under the License.
 """
+_LICENSE_STRIPPED = LICENSE_HEADER.rstrip("\n")
+
+
+@contextmanager
+def streamed_output(path: Path) -> Iterator[Callable[[str], None]]:
+    """
+    Yield a `write_line(s)` callable that streams `s` and a newline to a temporary
+    file next to `path`, hashing as it goes. On success the temporary file
+    replaces `path` only if the content changed, so unchanged outputs keep
+    their mtime and do not trigger a downstream `moon check`.
+    """
+    tmp = path.with_name(f".{path.name}.tmp")
+    h = hashlib.sha256()
+    try:
+        with tmp.open("wb", buffering=1 << 20) as f:
+
+            def write_line(s: str) -> None:
+                b = (s + "\n").encode("utf-8")
+                h.update(b)
+                f.write(b)
+
+            yield write_line
+        try:
+            unchanged = path.stat().st_size == tmp.stat().st_size and file_sha256(path) == h.hexdigest()
+        except FileNotFoundError:
+            unchanged = False
+        if not unchanged:
+            os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
 
 # WGPU handle types already exposed by `src/c/raw.mbt`.
 # We keep those names working by exporting them as aliases to the official
@@ -72,112 +119,219 @@ HANDLE_TYPE_ALIASES: dict[str, str] = {
 }
 
 
-def strip_comments(s: str) -> str:
-    s = re.sub(r"/\*.*?\*/", "", s, flags=re.S)
-    s = re.sub(r"//.*?$", "", s, flags=re.M)
-    return s
+def _decode_text(raw: bytes) -> str:
+    # The newline translation read_text() would apply: the `$`-anchored
+    # patterns below must also match on a CRLF checkout.
+    return raw.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def drop_comments(s: str) -> str:
+    # Plain string scan: drops each `/* ... */` block (left alone when
+    # unterminated) and each `//` up to the newline.
+    out: list[str] = []
+    start = 0
+    pos = s.find("/")
+    while pos != -1:
+        nxt = s[pos + 1 : pos + 2]
+        if nxt == "*":
+            end = s.find("*/", pos + 2)
+            if end != -1:
+                out.append(s[start:pos])
+                start = end + 2
+                pos = s.find("/", start)
+                continue
+        elif nxt == "/":
+            out.append(s[start:pos])
+            end = s.find("\n", pos + 2)
+            start = len(s) if end == -1 else end
+            pos = s.find("/", start)
+            continue
+        pos = s.find("/", pos + 1)
+    if not out:
+        return s
+    out.append(s[start:])
+    return "".join(out)
 
 
-@dataclass(frozen=True)
-class Param:
+class Param(NamedTuple):
     name: str
     mbt_type: str
 
 
-@dataclass(frozen=True)
-class Func:
+class Func(NamedTuple):
     name: str
     ret: str
-    params: list[Param]
+    params: tuple[Param, ...]
 
 
-_WS = re.compile(r"\s+")
+# Common qualifiers/macros that carry no information for the MoonBit type.
+_RE_QUALS = re.compile(r"\b(?:const|struct|WGPU_NULLABLE|WGPU_NONNULL)\b", re.ASCII)
 
 
 def norm_ws(s: str) -> str:
-    return _WS.sub(" ", s).strip()
+    # Same result as collapsing `\s+` runs and stripping, without the regex.
+    return " ".join(s.split())
+
+
+# MoonBit builtin types the C primitives map to.
+_BUILTIN_MBT = frozenset({"Unit", "Int", "UInt", "UInt64", "Float", "Double", "Bool", "Byte"})
+
+# MoonBit keywords that cannot be used as parameter names, and their renames.
+_RESERVED_RENAMES: dict[str, str] = {kw: f"{kw}_" for kw in ("type", "let", "pub", "fn", "match")}
+
+# Primitive C type -> MoonBit type mappings.
+_PRIM: dict[str, str] = {
+    "void": "Unit",
+    "char": "Byte",  # only used via pointers
+    "int": "Int",
+    "int32_t": "Int",
+    "uint32_t": "UInt",
+    "uint16_t": "UInt",
+    "uint8_t": "UInt",
+    "uint64_t": "UInt64",
+    "size_t": "UInt64",
+    "float": "Float",
+    "double": "Double",
+    "WGPUBool": "Bool",
+}
 
 
+# The header only uses a small vocabulary of C types, so memoize the mapping.
+@lru_cache(maxsize=None)
 def mbt_type_for_c(c_ty: str, pointer_depth: int) -> str:
-    c_ty = norm_ws(c_ty)
-    # Remove common qualifiers/macros anywhere (not just prefixes).
-    c_ty = re.sub(r"\bconst\b", "", c_ty)
-    c_ty = re.sub(r"\bstruct\b", "", c_ty)
-    c_ty = re.sub(r"\bWGPU_NULLABLE\b", "", c_ty)
-    c_ty = re.sub(r"\bWGPU_NONNULL\b", "", c_ty)
-    c_ty = norm_ws(c_ty)
-
-    # Primitive mappings.
-    prim = {
-        "void": "Unit",
-        "char": "Byte",  # only used via pointers
-        "int": "Int",
-        "int32_t": "Int",
-        "uint32_t": "UInt",
-        "uint16_t": "UInt",
-        "uint8_t": "UInt",
-        "uint64_t": "UInt64",
-        "size_t": "UInt64",
-        "float": "Float",
-        "double": "Double",
-        "WGPUBool": "Bool",
-    }
-
-    base = prim.get(c_ty, c_ty)
+    # Remove common qualifiers/macros anywhere (not just prefixes), then
+    # collapse the whitespace left behind in one go.
+    c_ty = norm_ws(_RE_QUALS.sub("", c_ty))
+
+    # Results are interned: different C spellings of one type then share a
+    # single string object, so the type sets/dicts downstream compare by identity.
+    base = _PRIM.get(c_ty, c_ty)
     if pointer_depth <= 0:
-        return base
+        return sys.intern(base)
     # Preserve pointer-ness as an abstract pointer wrapper type.
     # (We don't attempt to model actual pointers in MoonBit for now.)
     suffix = "Ptr" * pointer_depth
-    return f"{base}{suffix}"
+    return sys.intern(f"{base}{suffix}")
 
-def parse_enum_type_names(h_text: str) -> set[str]:
-    # Match both `typedef enum Name { ... } Name;` and `typedef enum { ... } Name;`.
-    out: set[str] = set()
-    for m in re.finditer(
-        r"typedef\s+enum(?:\s+\w+)?\s*\{.*?\}\s*(\w+)\s*;", h_text, flags=re.S
-    ):
-        out.add(m.group(1))
-    return out
 
+_ASCII_SPACE = frozenset(" \t\n\r\f\v")
+_ASCII_WORD = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_")
 
-def parse_simple_typedef_aliases(h_text: str) -> dict[str, str]:
-    # Parse single-line typedefs like:
-    #   typedef uint64_t WGPUFlags;
-    #   typedef WGPUFlags WGPUBufferUsage;
-    #
-    # Ignore typedefs with attributes / function pointer typedefs / struct+enum bodies.
-    out: dict[str, str] = {}
-    for line in h_text.splitlines():
-        s = norm_ws(line)
-        if not s.startswith("typedef "):
-            continue
-        if not s.endswith(";"):
-            continue
-        if "{" in s or "}" in s:
+
+def _skip_space(text: str, i: int) -> int:
+    n = len(text)
+    while i < n and text[i] in _ASCII_SPACE:
+        i += 1
+    return i
+
+
+def _skip_word(text: str, i: int) -> int:
+    n = len(text)
+    while i < n and text[i] in _ASCII_WORD:
+        i += 1
+    return i
+
+
+def _iter_typedef_enums(h_text: str) -> Iterator[tuple[str, str]]:
+    r"""
+    Yield `(body, name)` for each `typedef enum [Tag] { body } name;`.
+
+    Single forward scan equivalent to finditer over
+      typedef\s+enum(?:\s+\w+)?\s*\{(.*?)\}\s*(\w+)\s*;
+    including its lazy-body behavior: a `}` not directly followed by
+    `name;` (e.g. `} Name WGPU_ENUM_ATTRIBUTE;`) does not close the body.
+    """
+    n = len(h_text)
+    i = 0
+    while True:
+        i = h_text.find("typedef", i)
+        if i == -1:
+            return
+        start = i
+        i += 1
+        j = _skip_space(h_text, start + 7)
+        if j == start + 7 or not h_text.startswith("enum", j):
             continue
-        if "WGPU_OBJECT_ATTRIBUTE" in s or "WGPU_FUNCTION_ATTRIBUTE" in s:
+        j += 4
+        k = _skip_space(h_text, j)
+        if k > j and k < n and h_text[k] in _ASCII_WORD:
+            k = _skip_space(h_text, _skip_word(h_text, k))
+        if k >= n or h_text[k] != "{":
             continue
-        # Remove trailing ';'
-        s = s[:-1].strip()
-        # Strip `typedef`
-        s = s[len("typedef ") :].strip()
-        # If this is a function pointer typedef, skip.
-        if "(" in s or ")" in s:
+        body_start = k + 1
+        c = body_start
+        while True:
+            c = h_text.find("}", c)
+            if c == -1:
+                # No later `}` can close any body either.
+                return
+            e = _skip_space(h_text, c + 1)
+            name_end = _skip_word(h_text, e)
+            f = _skip_space(h_text, name_end)
+            if name_end > e and f < n and h_text[f] == ";":
+                yield h_text[body_start:c], h_text[e:name_end]
+                i = f + 1
+                break
+            c += 1
+
+
+def parse_enum_type_names(h_text: str) -> set[str]:
+    # Match both `typedef enum Name { ... } Name;` and `typedef enum { ... } Name;`.
+    return {name for _, name in _iter_typedef_enums(h_text)}
+
+
+# Whole-line declarations we care about, one alternative per kind:
+#   typedef uint64_t WGPUFlags;
+#   #define WGPU_WHOLE_SIZE (UINT64_MAX)
+#   static const WGPUBufferUsage WGPUBufferUsage_None = 0x0000000000000000;
+# Typedefs with bodies, parens (function pointers) or `;` in the middle are
+# not simple aliases and never match.
+_RE_LINE_DECL = re.compile(
+    r"^[ \t]*(?:"
+    r"typedef[ \t]+(?P<td_rhs>[^;{}()\n]*?)[ \t]+(?P<td_name>[^\s;{}()]+)[ \t]*;"
+    r"|#define[ \t]+(?P<macro>\S+)[ \t]+\([ \t]*(?P<macro_val>UINT32_MAX|UINT64_MAX|SIZE_MAX)[ \t]*\)"
+    r"|static[ \t]+const[ \t]+(?P<sc_ty>\w+)[ \t]+(?P<sc_name>\w+)[ \t]*=[ \t]*(?P<sc_rhs>[^;\n]+?)[ \t]*;"
+    r")[ \t]*$",
+    re.M | re.ASCII,
+)
+
+
+@dataclass
+class LineDecls:
+    # Simple typedef aliases, e.g. WGPUBufferUsage -> WGPUFlags.
+    typedef_aliases: dict[str, str]
+    # Numeric #defines as (name, mbt_type, value).
+    numeric_macros: list[tuple[str, str, int]]
+    # `static const` definitions as (c_type, name, rhs); rhs is not validated.
+    static_consts: list[tuple[str, str, str]]
+
+
+def scan_line_decls(h_text: str) -> LineDecls:
+    """
+    Collect simple typedef aliases, numeric #defines and `static const`
+    numbers from comment-stripped header text in a single pass.
+    """
+    decls = LineDecls({}, [], [])
+    for m in _RE_LINE_DECL.finditer(h_text):
+        name = m.group("td_name")
+        if name is not None:
+            # Ignore typedefs with attributes.
+            s = m.group(0)
+            if "WGPU_OBJECT_ATTRIBUTE" in s or "WGPU_FUNCTION_ATTRIBUTE" in s:
+                continue
+            # Normalize common qualifiers/macros for rhs.
+            decls.typedef_aliases[name] = norm_ws(_RE_QUALS.sub("", m.group("td_rhs")))
             continue
-        parts = s.split(" ")
-        if len(parts) < 2:
+        name = m.group("macro")
+        if name is not None:
+            if m.group("macro_val") == "UINT32_MAX":
+                decls.numeric_macros.append((name, "UInt", 0xFFFF_FFFF))
+            else:
+                # UINT64_MAX, or SIZE_MAX: we treat size_t as 64-bit in our ABI layer.
+                decls.numeric_macros.append((name, "UInt64", 0xFFFF_FFFF_FFFF_FFFF))
             continue
-        name = parts[-1]
-        rhs = " ".join(parts[:-1]).strip()
-        # Normalize common qualifiers/macros for rhs.
-        rhs = re.sub(r"\\bconst\\b", "", rhs)
-        rhs = re.sub(r"\\bstruct\\b", "", rhs)
-        rhs = re.sub(r"\\bWGPU_NULLABLE\\b", "", rhs)
-        rhs = re.sub(r"\\bWGPU_NONNULL\\b", "", rhs)
-        rhs = norm_ws(rhs)
-        out[name] = rhs
-    return out
+        decls.static_consts.append(m.group("sc_ty", "sc_name", "sc_rhs"))
+    return decls
 
 
 def resolve_typedef_primitives(typedef_aliases: dict[str, str]) -> dict[str, str]:
@@ -190,37 +344,42 @@ def resolve_typedef_primitives(typedef_aliases: dict[str, str]) -> dict[str, str
       WGPUTextureUsage -> UInt64   (via WGPUFlags)
     """
     resolved: dict[str, str] = {}
-
-    def resolve(name: str, seen: set[str]) -> str | None:
-        if name in resolved:
-            return resolved[name]
-        if name in seen:
-            return None
-        seen.add(name)
-        rhs = typedef_aliases.get(name)
-        if rhs is None:
-            return None
-        # Direct primitive typedef.
-        mbt = mbt_type_for_c(rhs, 0)
-        if mbt in {"Unit", "Int", "UInt", "UInt64", "Float", "Double", "Bool", "Byte"}:
-            resolved[name] = mbt
-            return mbt
-        # Try to resolve through another typedef name.
-        chained = resolve(rhs, seen)
-        if chained is not None:
-            resolved[name] = chained
-            return chained
-        return None
-
-    for name in list(typedef_aliases.keys()):
-        resolve(name, set())
+    # Names already walked. Whatever is not in `resolved` by now is unresolvable
+    # (unknown, non-primitive, or part of a cycle).
+    visited: set[str] = set()
+
+    for name in typedef_aliases:
+        # Walk the alias chain forward, then assign its primitive to every link.
+        chain: list[str] = []
+        cur = name
+        final: str | None = None
+        while cur not in visited:
+            visited.add(cur)
+            rhs = typedef_aliases.get(cur)
+            if rhs is None:
+                break
+            chain.append(cur)
+            # Direct primitive typedef.
+            mbt = mbt_type_for_c(rhs, 0)
+            if mbt in _BUILTIN_MBT:
+                final = mbt
+                break
+            # Try to resolve through another typedef name.
+            cur = rhs
+        else:
+            final = resolved.get(cur)
+        if final is not None:
+            for k in chain:
+                resolved[k] = final
     return resolved
 
 
 _CAMEL_BOUNDARY_1 = re.compile(r"([a-z0-9])([A-Z])")
 _CAMEL_BOUNDARY_2 = re.compile(r"([A-Z]+)([A-Z][a-z])")
+_DIGIT_LETTER_TOKEN = re.compile(r"(\d)_([a-z])(?=\b|_)")
 
 
+@lru_cache(maxsize=None)
 def camel_to_snake(s: str) -> str:
     # Handle acronyms + digit boundaries reasonably well.
     s = _CAMEL_BOUNDARY_2.sub(r"\1_\2", s)
@@ -228,10 +387,11 @@ def camel_to_snake(s: str) -> str:
     s = s.replace("__", "_").lower()
     # Prefer `2d` over `2_d` when the trailing letter is a whole token
     # (e.g. `2D`, `3D`, `2DArray`).
-    s = re.sub(r"(\d)_([a-z])(?=\b|_)", r"\1\2", s)
+    s = _DIGIT_LETTER_TOKEN.sub(r"\1\2", s)
     return s
 
 
+@lru_cache(maxsize=None)
 def c_constant_to_mbt_name(c_name: str) -> str:
     # Examples:
     #   WGPUBufferUsage_CopySrc -> buffer_usage_copy_src
@@ -258,76 +418,28 @@ def mbt_int_literal(value: int, mbt_ty: str) -> str:
     return f"0x{value:08X}U"
 
 
-def parse_simple_numeric_macros(h_text: str) -> list[tuple[str, str, int]]:
-    """
-    Parse a tiny subset of numeric #defines we want to expose:
-      #define WGPU_WHOLE_SIZE (UINT64_MAX)
-      #define WGPU_ARRAY_LAYER_COUNT_UNDEFINED (UINT32_MAX)
-      #define WGPU_WHOLE_MAP_SIZE (SIZE_MAX)
-    """
-    out: list[tuple[str, str, int]] = []
-    for line in h_text.splitlines():
-        s = line.strip()
-        if not s.startswith("#define "):
-            continue
-        parts = s.split(None, 2)
-        if len(parts) < 3:
-            continue
-        name = parts[1]
-        rhs = parts[2].strip()
-        # Only accept simple paren-wrapped tokens.
-        m = re.fullmatch(r"\(([^()]+)\)", rhs)
-        if not m:
-            continue
-        token = m.group(1).strip()
-        if token == "UINT32_MAX":
-            out.append((name, "UInt", 0xFFFF_FFFF))
-        elif token == "UINT64_MAX":
-            out.append((name, "UInt64", 0xFFFF_FFFF_FFFF_FFFF))
-        elif token == "SIZE_MAX":
-            # We treat size_t as 64-bit in our ABI layer.
-            out.append((name, "UInt64", 0xFFFF_FFFF_FFFF_FFFF))
-    return out
+# One `Name = <int literal>[,]` enumerator per line.
+_RE_ENUM_ENTRY = re.compile(
+    r"^[ \t]*(\w+)[ \t]*=[ \t]*(0[xX][0-9a-fA-F]+|\d+)[ \t]*,?[ \t]*$", re.M | re.ASCII
+)
 
 
-def parse_enum_constants(h_text: str) -> list[tuple[str, str, int]]:
-    out: list[tuple[str, str, int]] = []
-    # Match `typedef enum [Name]? { ... } Name;`
-    for m in re.finditer(
-        r"typedef\s+enum(?:\s+\w+)?\s*\{(?P<body>.*?)\}\s*(?P<ty>\w+)\s*;",
-        h_text,
-        flags=re.S,
-    ):
-        body = m.group("body")
-        for line in body.splitlines():
-            s = norm_ws(strip_comments(line))
-            if not s or "=" not in s:
-                continue
-            # trim trailing commas
-            if s.endswith(","):
-                s = s[:-1].strip()
-            name, rhs = [p.strip() for p in s.split("=", 1)]
+def parse_enum_constants(h_text: str) -> Iterator[tuple[str, str, int]]:
+    # Expects comment-stripped text.
+    for body, _ in _iter_typedef_enums(h_text):
+        for e in _RE_ENUM_ENTRY.finditer(body):
             # Only accept numeric assignments.
             try:
-                val = int(rhs, 0)
+                val = int(e.group(2), 0)
             except ValueError:
                 continue
-            out.append((name, "UInt", val))
-    return out
+            yield (e.group(1), "UInt", val)
 
 
-def parse_static_const_numbers(h_text: str, resolved_typedefs: dict[str, str]) -> list[tuple[str, str, int]]:
-    out: list[tuple[str, str, int]] = []
-    for line in h_text.splitlines():
-        s = norm_ws(strip_comments(line))
-        if not s.startswith("static const "):
-            continue
-        if not s.endswith(";"):
-            continue
-        m = re.match(r"static const\s+(\w+)\s+(\w+)\s*=\s*(.+);$", s)
-        if not m:
-            continue
-        c_ty, name, rhs = m.group(1), m.group(2), m.group(3).strip()
+def parse_static_const_numbers(
+    static_consts: list[tuple[str, str, str]], resolved_typedefs: dict[str, str]
+) -> Iterator[tuple[str, str, int]]:
+    for c_ty, name, rhs in static_consts:
         try:
             val = int(rhs, 0)
         except ValueError:
@@ -336,103 +448,169 @@ def parse_static_const_numbers(h_text: str, resolved_typedefs: dict[str, str]) -
         # In the header, many consts are enum-typed; treat those as UInt.
         if mbt_ty not in ("UInt64", "UInt"):
             mbt_ty = "UInt"
-        out.append((name, mbt_ty, val))
-    return out
-
-
-def write_webgpu_consts() -> None:
-    webgpu_h = strip_comments(WEBGPU_H.read_text("utf-8"))
-    wgpu_h = strip_comments(WGPU_H.read_text("utf-8"))
-    combined = webgpu_h + "\n" + wgpu_h
-    typedef_aliases = parse_simple_typedef_aliases(combined)
-    resolved = resolve_typedef_primitives(typedef_aliases)
-
-    items: list[tuple[str, str, int]] = []
-    items.extend(parse_simple_numeric_macros(combined))
-    items.extend(parse_static_const_numbers(combined, resolved))
-    items.extend(parse_enum_constants(combined))
+        yield (name, mbt_ty, val)
+
+
+_CONSTS_PROLOGUE = "\n".join(
+    (
+        _LICENSE_STRIPPED,
+        "",
+        "///|",
+        "/// WebGPU constants (generated from `webgpu.h`).",
+        "///",
+        "/// This file intentionally exposes the full constant surface (enums,",
+        "/// bitflags, and a small subset of numeric `#define`s) for MoonBit usage.",
+    )
+)
+_CONST_TMPL = "\n///|\npub const {name} : {ty} = {lit}"
+
+
+def write_webgpu_consts(combined: str, decls: LineDecls, resolved: dict[str, str]) -> None:
+    # `combined` is the comment-stripped text of both headers; `decls` and
+    # `resolved` (its typedef primitives) are computed once by `main`.
+    items = chain(
+        decls.numeric_macros,
+        parse_static_const_numbers(decls.static_consts, resolved),
+        parse_enum_constants(combined),
+    )
 
     # Deduplicate by name (keep first occurrence).
-    seen: set[str] = set()
-    uniq: list[tuple[str, str, int]] = []
+    uniq: dict[str, tuple[str, int]] = {}
     for name, ty, val in items:
-        if name in seen:
-            continue
-        seen.add(name)
-        uniq.append((name, ty, val))
-
-    uniq.sort(key=lambda t: t[0])
-
-    out_lines: list[str] = []
-    out_lines.append(LICENSE_HEADER.rstrip())
-    out_lines.append("")
-    out_lines.append("///|")
-    out_lines.append("/// WebGPU constants (generated from `webgpu.h`).")
-    out_lines.append("///")
-    out_lines.append("/// This file intentionally exposes the full constant surface (enums,")
-    out_lines.append("/// bitflags, and a small subset of numeric `#define`s) for MoonBit usage.")
-    out_lines.append("")
+        uniq.setdefault(name, (ty, val))
+
+    with streamed_output(OUT_CONSTS) as write_line:
+        write_line(_CONSTS_PROLOGUE)
+        for c_name, (mbt_ty, val) in sorted(uniq.items()):
+            lit = mbt_int_literal(val, mbt_ty)
+            write_line(_CONST_TMPL.format(name=c_constant_to_mbt_name(c_name), ty=mbt_ty, lit=lit))
+
+
+_RE_PARAM_TOKEN = re.compile(r"\*|,|[A-Za-z_][A-Za-z0-9_]*")
+_QUALIFIERS = frozenset({"const", "struct", "WGPU_NULLABLE", "WGPU_NONNULL"})
+
+
+def _param_from_tokens(idents: list[str], stars: int, ends_with_star: bool) -> Param:
+    # `idents` are the parameter's identifiers in order and `stars` its '*'
+    # count; the last token names the parameter.
+    if ends_with_star:
+        name_tok = "*"
+        n_base = len(idents)
+        stars -= 1
+    else:
+        name_tok = idents[-1]
+        n_base = len(idents) - 1
+    # Most parameters have a single type token; skip the join for those.
+    if n_base == 0:
+        ty_tok = "void"
+    elif n_base == 1:
+        ty_tok = idents[0]
+    else:
+        ty_tok = " ".join(idents[:n_base])
+    mbt_ty = mbt_type_for_c(ty_tok, stars)
+    # Avoid reserved keywords.
+    return Param(_RESERVED_RENAMES.get(name_tok, name_tok), mbt_ty)
+
+
+def _parse_params(params_c: str) -> tuple[Param, ...]:
+    params_c = params_c.strip()
+    if not params_c or params_c == "void":
+        return ()
+    params: list[Param] = []
+    idents: list[str] = []
+    stars = 0
+    ends_with_star = False
+    # One tokenizing pass over the whole list: identifiers, '*' and the ','
+    # separators, minus qualifiers. Stars are only counted. A trailing ','
+    # flushes the last parameter.
+    for t in _RE_PARAM_TOKEN.findall(params_c + ","):
+        if t == ",":
+            if idents or stars:
+                params.append(_param_from_tokens(idents, stars, ends_with_star))
+                idents = []
+                stars = 0
+                ends_with_star = False
+        elif t == "*":
+            stars += 1
+            ends_with_star = True
+        elif t not in _QUALIFIERS:
+            idents.append(t)
+            ends_with_star = False
+    return tuple(params)
+
+
+def _make_func(ret_c: str, name: str, params_c: str) -> Func:
+    ret_star_depth = ret_c.count("*")
+    # Normalize before the (memoized) lookup so differently wrapped
+    # prototypes share cache entries.
+    ret = mbt_type_for_c(norm_ws(ret_c.replace("*", "")), ret_star_depth)
+    return Func(name, ret, _parse_params(params_c))
+
+
+def _split_export(decl: str) -> tuple[str, str, str] | None:
+    """
+    Split the text between `WGPU_EXPORT` and the next `;` of a prototype, e.g.
 
-    for c_name, mbt_ty, val in uniq:
-        mbt_name = c_constant_to_mbt_name(c_name)
-        lit = mbt_int_literal(val, mbt_ty)
-        out_lines.append("///|")
-        out_lines.append(f"pub const {mbt_name} : {mbt_ty} = {lit}")
-        out_lines.append("")
+      WGPU_EXPORT WGPUInstance wgpuCreateInstance(WGPUInstanceDescriptor const * descriptor) WGPU_FUNCTION_ATTRIBUTE;
 
-    OUT_CONSTS.write_text("\n".join(out_lines).rstrip() + "\n", "utf-8")
+    into (return type, name, params), or None if it is not a `wgpu*` prototype.
+    The return type is the shortest prefix followed by whitespace and a
+    `wgpu<word>(`; params run up to the first `)`.
+    """
+    ret_start = _skip_space(decl, 0)
+    if ret_start == 0:
+        return None
+    i = decl.find("wgpu", ret_start + 1)
+    while i != -1:
+        ret_end = i
+        while ret_end > ret_start and decl[ret_end - 1] in _ASCII_SPACE:
+            ret_end -= 1
+        name_end = _skip_word(decl, i + 4)
+        if ret_start < ret_end < i and name_end > i + 4:
+            open_paren = _skip_space(decl, name_end)
+            if open_paren < len(decl) and decl[open_paren] == "(":
+                close_paren = decl.find(")", open_paren + 1)
+                if close_paren == -1:
+                    return None
+                return decl[ret_start:ret_end], decl[i:name_end], decl[open_paren + 1 : close_paren]
+        i = decl.find("wgpu", i + 1)
+    return None
 
 
 def parse_exported_functions(h_text: str) -> list[Func]:
     out: list[Func] = []
-    for m in re.finditer(r"WGPU_EXPORT\s+.*?;", h_text, flags=re.S):
-        proto = norm_ws(m.group(0))
-        if "typedef" in proto:
+    # Walk the `WGPU_EXPORT ... ;` statements with plain string search; only
+    # the short statement text is inspected further.
+    pos = 0
+    while (hit := h_text.find("WGPU_EXPORT", pos)) != -1:
+        end = h_text.find(";", hit)
+        if end == -1:
+            break
+        decl = h_text[hit + len("WGPU_EXPORT") : end]
+        if "typedef" in decl:
+            # Dropped either way. Only split it when a nested WGPU_EXPORT
+            # could start the next prototype, since that depends on where
+            # the scan resumes.
+            if "WGPU_EXPORT" not in decl:
+                pos = end + 1
+                continue
+            pos = end + 1 if _split_export(decl) is not None else hit + 1
             continue
-        # Example:
-        #   WGPU_EXPORT WGPUInstance wgpuCreateInstance(WGPUInstanceDescriptor const * descriptor);
-        mm = re.match(
-            r"WGPU_EXPORT\s+(.+?)\s+(wgpu\w+)\s*\((.*?)\)\s*[^;]*;",
-            proto,
-        )
-        if not mm:
+        parts = _split_export(decl)
+        if parts is None:
+            pos = hit + 1
             continue
-        ret_c, name, params_c = mm.group(1), mm.group(2), mm.group(3)
-        ret_star_depth = ret_c.count("*")
-        ret_c = ret_c.replace("*", "")
-        ret = mbt_type_for_c(ret_c, ret_star_depth)
-        params: list[Param] = []
-        params_c = params_c.strip()
-        if params_c and params_c != "void":
-            parts = [p.strip() for p in params_c.split(",")]
-            for i, p in enumerate(parts):
-                p = norm_ws(p)
-                # Normalize and strip qualifiers.
-                p = re.sub(r"\bconst\b", "", p)
-                p = re.sub(r"\bstruct\b", "", p)
-                p = re.sub(r"\bWGPU_NULLABLE\b", "", p)
-                p = re.sub(r"\bWGPU_NONNULL\b", "", p)
-                p = norm_ws(p)
-
-                # Tokenize with '*' as separate tokens.
-                p = p.replace("*", " * ")
-                tokens = [t for t in p.split(" ") if t]
-                if not tokens:
-                    continue
-                name_tok = tokens[-1]
-                ty_tokens = tokens[:-1]
-                star_depth = sum(1 for t in ty_tokens if t == "*")
-                base_tokens = [t for t in ty_tokens if t != "*"]
-                ty_tok = " ".join(base_tokens) if base_tokens else "void"
-                mbt_ty = mbt_type_for_c(ty_tok, star_depth)
-                # Avoid reserved keywords.
-                if name_tok in {"type", "let", "pub", "fn", "match"}:
-                    name_tok = f"{name_tok}_"
-                params.append(Param(name=name_tok, mbt_type=mbt_ty))
-        out.append(Func(name=name, ret=ret, params=params))
+        pos = end + 1
+        ret_c, name, params_c = parts
+        out.append(_make_func(ret_c, name, params_c))
     return out
 
 
+# A whitespace-normalized prototype without WGPU_EXPORT, e.g.
+#   void wgpuSetLogLevel(WGPULogLevel level);
+_RE_PROTO = re.compile(r"(.+?)\s+(wgpu\w+)\s*\((.*?)\)\s*;")
+
+
 def parse_any_functions(h_text: str) -> list[Func]:
     """
     Parse non-WGPU_EXPORT function prototypes (e.g. wgpu-native extras in wgpu.h).
@@ -468,194 +646,148 @@ def parse_any_functions(h_text: str) -> list[Func]:
             continue
         if "wgpu" not in proto:
             continue
-        mm = re.match(r"(.+?)\s+(wgpu\w+)\s*\((.*?)\)\s*;", proto)
+        mm = _RE_PROTO.match(proto)
         if not mm:
             continue
-        ret_c, name, params_c = mm.group(1), mm.group(2), mm.group(3)
-        ret_star_depth = ret_c.count("*")
-        ret_c = ret_c.replace("*", "")
-        ret = mbt_type_for_c(ret_c, ret_star_depth)
-
-        params: list[Param] = []
-        params_c = params_c.strip()
-        if params_c and params_c != "void":
-            parts = [p.strip() for p in params_c.split(",")]
-            for p in parts:
-                p = norm_ws(p)
-                p = re.sub(r"\bconst\b", "", p)
-                p = re.sub(r"\bstruct\b", "", p)
-                p = re.sub(r"\bWGPU_NULLABLE\b", "", p)
-                p = re.sub(r"\bWGPU_NONNULL\b", "", p)
-                p = norm_ws(p)
-
-                p = p.replace("*", " * ")
-                tokens = [t for t in p.split(" ") if t]
-                if not tokens:
-                    continue
-                name_tok = tokens[-1]
-                ty_tokens = tokens[:-1]
-                star_depth = sum(1 for t in ty_tokens if t == "*")
-                base_tokens = [t for t in ty_tokens if t != "*"]
-                ty_tok = " ".join(base_tokens) if base_tokens else "void"
-                mbt_ty = mbt_type_for_c(ty_tok, star_depth)
-                if name_tok in {"type", "let", "pub", "fn", "match"}:
-                    name_tok = f"{name_tok}_"
-                params.append(Param(name=name_tok, mbt_type=mbt_ty))
-        out.append(Func(name=name, ret=ret, params=params))
+        out.append(_make_func(mm.group(1), mm.group(2), mm.group(3)))
     return out
 
 
-def collect_types(funcs: list[Func]) -> set[str]:
-    tys: set[str] = set()
-    for f in funcs:
-        tys.add(f.ret)
-        for p in f.params:
-            tys.add(p.mbt_type)
-    # Filter out builtins.
-    builtins = {
-        "Unit",
-        "Int",
-        "UInt",
-        "UInt64",
-        "Float",
-        "Double",
-        "Bool",
-        "Byte",
-    }
-    tys = {t for t in tys if t not in builtins}
-    # Only keep WGPU* or related pointer wrapper types.
-    return tys
-
-
-def write_spec(
+_SPEC_PROLOGUE = "\n".join(
+    (
+        _LICENSE_STRIPPED,
+        "",
+        "///|",
+        "/// WebGPU C API contract (generated from webgpu.h).",
+        "///",
+        "/// This is a declaration-only mirror of the upstream header.",
+        "/// It is meant for spec-first / test-first development:",
+        "/// - `moon check` must stay green",
+        "/// - `moon test` is allowed to be red until the real FFI is implemented",
+        "///",
+        "/// Generated by: scripts/gen_webgpu_capi_spec.py",
+    )
+)
+
+
+_TYPE_ENUM_TMPL = "\n///|\npub type {name} = UInt"
+_TYPE_TYPEDEF_TMPL = "\n///|\npub type {name} = {prim}"
+_TYPE_OPAQUE_TMPL = "\n///|\n#declaration_only\npub type {name}"
+# Use `declare` for declaration-only functions so tooling like
+# `moon test --enable-coverage` can compile the package without needing
+# placeholder bodies.
+_FUNC_TMPL = "\n///|\n#declaration_only\ndeclare pub fn {name}({params}) -> {ret}"
+
+
+_IMPL_PROLOGUE = "\n".join(
+    (
+        _LICENSE_STRIPPED,
+        "",
+        "///|",
+        "/// WebGPU C API bindings (generated).",
+        "///",
+        "/// This file exists to satisfy `#declaration_only` items in",
+        "/// `src/c/webgpu_capi_spec.mbt`, so `moon check` has zero",
+        "/// `declaration_unimplemented` warnings.",
+        "///",
+        "/// Generated by: scripts/gen_webgpu_capi_spec.py",
+    )
+)
+
+
+def _impl_alias_line(t: str) -> str:
+    # Returns the `#alias(...)` line (with trailing newline) for an opaque type,
+    # or "" when the type needs no alias.
+    alias = HANDLE_TYPE_ALIASES.get(t)
+    if alias is not None:
+        return f"#alias({alias})\n"
+    if t not in {"UIntPtr", "UnitPtr"} and t.endswith("Ptr"):
+        return "#alias(UnitPtr)\n"
+    return ""
+
+
+_TYPE_EXTERNAL_TMPL = "\n///|\n#external\n{alias}pub type {name}"
+_FUNC_EXTERN_TMPL = '\n///|\n{borrow}pub extern "C" fn {name}({params}) -> {ret} = "{name}"'
+
+
+_TEST_PROLOGUE = "\n".join(
+    (
+        _LICENSE_STRIPPED,
+        "",
+        "///|",
+        'test "spec: webgpu.h symbol coverage (expected red)" {',
+        "  // This block is never executed; it only forces the compiler to resolve symbols.",
+        "  if false {",
+    )
+)
+_TEST_EPILOGUE = "\n".join(
+    (
+        "  }",
+        "  // Snapshot a stable marker so this stays green while providing symbol coverage.",
+        '  inspect("symbol coverage ok", content="symbol coverage ok")',
+        "}",
+    )
+)
+
+
+def write_all(
     funcs: list[Func],
-    types: set[str],
+    types: list[str],
     enum_types: set[str],
     typedef_primitives: dict[str, str],
 ) -> None:
-    # Keep output stable.
-    type_list = sorted(types)
-    func_list = sorted(funcs, key=lambda f: f.name)
-
-    lines: list[str] = []
-    lines.append(LICENSE_HEADER.rstrip("\n"))
-    lines.append("")
-    lines.append("///|")
-    lines.append("/// WebGPU C API contract (generated from webgpu.h).")
-    lines.append("///")
-    lines.append("/// This is a declaration-only mirror of the upstream header.")
-    lines.append("/// It is meant for spec-first / test-first development:")
-    lines.append("/// - `moon check` must stay green")
-    lines.append("/// - `moon test` is allowed to be red until the real FFI is implemented")
-    lines.append("///")
-    lines.append("/// Generated by: scripts/gen_webgpu_capi_spec.py")
-
-    for t in type_list:
-        lines.append("")
-        lines.append("///|")
-        if t in enum_types:
-            lines.append(f"pub type {t} = UInt")
-        elif t in typedef_primitives:
-            lines.append(f"pub type {t} = {typedef_primitives[t]}")
-        else:
-            lines.append("#declaration_only")
-            lines.append(f"pub type {t}")
-
-    for f in func_list:
-        lines.append("")
-        lines.append("///|")
-        lines.append("#declaration_only")
-        if f.params:
-            params = ", ".join(f"{p.name} : {p.mbt_type}" for p in f.params)
-        else:
-            params = ""
-        # Use `declare` for declaration-only functions so tooling like
-        # `moon test --enable-coverage` can compile the package without needing
-        # placeholder bodies.
-        lines.append(f"declare pub fn {f.name}({params}) -> {f.ret}")
-
-    OUT_SPEC.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    """
+    Write the spec, impl and symbol-test files from one pass over the
+    (sorted, see `main`) types and functions.
+    """
+    with ExitStack() as stack:
+        spec = stack.enter_context(streamed_output(OUT_SPEC))
+        impl = stack.enter_context(streamed_output(OUT_IMPL))
+        test = stack.enter_context(streamed_output(OUT_TEST))
+        spec(_SPEC_PROLOGUE)
+        impl(_IMPL_PROLOGUE)
+        test(_TEST_PROLOGUE)
+
+        for t in types:
+            prim = typedef_primitives.get(t)
+            if t in enum_types:
+                spec(_TYPE_ENUM_TMPL.format(name=t))
+            elif prim is not None:
+                spec(_TYPE_TYPEDEF_TMPL.format(name=t, prim=prim))
+            else:
+                spec(_TYPE_OPAQUE_TMPL.format(name=t))
+                # Concrete value types are defined in `webgpu_capi_spec.mbt`.
+                # Minimal representation to make signatures type-check.
+                # Model all WebGPU CAPI types as opaque external handles for now.
+                impl(_TYPE_EXTERNAL_TMPL.format(alias=_impl_alias_line(t), name=t))
 
+        for f in funcs:
+            params = ", ".join([f"{p.name} : {p.mbt_type}" for p in f.params])
+            spec(_FUNC_TMPL.format(name=f.name, params=params, ret=f.ret))
+            borrow_params = [p.name for p in f.params if p.mbt_type.endswith("Ptr")]
+            borrow = f"#borrow({', '.join(borrow_params)})\n" if borrow_params else ""
+            impl(_FUNC_EXTERN_TMPL.format(borrow=borrow, name=f.name, params=params, ret=f.ret))
+            test(f"    let _ = @wgpu_c.{f.name}")
 
-def write_impl(
-    funcs: list[Func],
-    types: set[str],
-    enum_types: set[str],
-    typedef_primitives: dict[str, str],
-) -> None:
-    # Keep output stable.
-    type_list = sorted(types)
-    func_list = sorted(funcs, key=lambda f: f.name)
-
-    lines: list[str] = []
-    lines.append(LICENSE_HEADER.rstrip("\n"))
-    lines.append("")
-    lines.append("///|")
-    lines.append("/// WebGPU C API bindings (generated).")
-    lines.append("///")
-    lines.append("/// This file exists to satisfy `#declaration_only` items in")
-    lines.append("/// `src/c/webgpu_capi_spec.mbt`, so `moon check` has zero")
-    lines.append("/// `declaration_unimplemented` warnings.")
-    lines.append("///")
-    lines.append("/// Generated by: scripts/gen_webgpu_capi_spec.py")
-
-    for t in type_list:
-        if t in enum_types or t in typedef_primitives:
-            # Concrete value types are defined in `webgpu_capi_spec.mbt`.
-            continue
-        lines.append("")
-        lines.append("///|")
-        # Minimal representation to make signatures type-check.
-        # Model all WebGPU CAPI types as opaque external handles for now.
-        lines.append("#external")
-        alias = HANDLE_TYPE_ALIASES.get(t)
-        if alias is not None:
-            lines.append(f"#alias({alias})")
-        elif t not in {"UIntPtr", "UnitPtr"} and t.endswith("Ptr"):
-            lines.append("#alias(UnitPtr)")
-        lines.append(f"pub type {t}")
-
-    for f in func_list:
-        lines.append("")
-        lines.append("///|")
-        borrow_params = [p.name for p in f.params if p.mbt_type.endswith("Ptr")]
-        if borrow_params:
-            lines.append(f"#borrow({', '.join(borrow_params)})")
-        if f.params:
-            params = ", ".join(f"{p.name} : {p.mbt_type}" for p in f.params)
-        else:
-            params = ""
-        lines.append(f'pub extern "C" fn {f.name}({params}) -> {f.ret} = "{f.name}"')
-
-    OUT_IMPL.write_text("\n".join(lines) + "\n", encoding="utf-8")
-
-
-def write_symbol_test(funcs: list[Func]) -> None:
-    func_list = sorted(funcs, key=lambda f: f.name)
-    lines: list[str] = []
-    lines.append(LICENSE_HEADER.rstrip("\n"))
-    lines.append("")
-    lines.append("///|")
-    lines.append('test "spec: webgpu.h symbol coverage (expected red)" {')
-    lines.append("  // This block is never executed; it only forces the compiler to resolve symbols.")
-    lines.append("  if false {")
-    for f in func_list:
-        lines.append(f"    let _ = @wgpu_c.{f.name}")
-    lines.append("  }")
-    lines.append("  // Snapshot a stable marker so this stays green while providing symbol coverage.")
-    lines.append('  inspect("symbol coverage ok", content="symbol coverage ok")')
-    lines.append("}")
-    OUT_TEST.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        test(_TEST_EPILOGUE)
 
 
 def main() -> None:
-    webgpu_text = strip_comments(WEBGPU_H.read_text(encoding="utf-8"))
-    wgpu_text = strip_comments(WGPU_H.read_text(encoding="utf-8"))
+    webgpu_bytes = WEBGPU_H.read_bytes()
+    wgpu_bytes = WGPU_H.read_bytes()
+    # The generator itself is an input too: editing it must invalidate the cache.
+    input_hash = inputs_digest(webgpu_bytes, wgpu_bytes, Path(__file__).read_bytes())
+    if load_fresh_cache(CACHE_FILE, input_hash, REPO, OUTPUTS) is not None:
+        return
+
+    # Strip comments once up front so no scanner below can match inside one.
+    webgpu_text = drop_comments(_decode_text(webgpu_bytes))
+    wgpu_text = drop_comments(_decode_text(wgpu_bytes))
     combined_text = webgpu_text + "\n" + wgpu_text
 
     enum_types = parse_enum_type_names(combined_text)
-    typedef_aliases = parse_simple_typedef_aliases(combined_text)
-    typedef_primitives = resolve_typedef_primitives(typedef_aliases)
+    line_decls = scan_line_decls(combined_text)
+    typedef_primitives = resolve_typedef_primitives(line_decls.typedef_aliases)
 
     funcs: list[Func] = []
     funcs.extend(parse_exported_functions(webgpu_text))
@@ -663,18 +795,35 @@ def main() -> None:
     if not funcs:
         raise SystemExit("No functions found; header format changed?")
 
-    # De-duplicate by name+signature (best-effort).
-    uniq: dict[tuple[str, str, tuple[tuple[str, str], ...]], Func] = {}
+    # De-duplicate by name; the first declaration wins (webgpu.h before the
+    # wgpu-native extras). Collect the types of the kept declarations in the
+    # same pass.
+    uniq: dict[str, Func] = {}
+    tys: set[str] = set()
     for f in funcs:
-        sig = (f.name, f.ret, tuple((p.name, p.mbt_type) for p in f.params))
-        uniq[sig] = f
-    funcs = sorted(uniq.values(), key=lambda f: f.name)
-
-    types = collect_types(funcs)
-    write_spec(funcs, types, enum_types, typedef_primitives)
-    write_impl(funcs, types, enum_types, typedef_primitives)
-    write_symbol_test(funcs)
-    write_webgpu_consts()
+        if f.name in uniq:
+            continue
+        uniq[f.name] = f
+        tys.add(f.ret)
+        tys.update([p.mbt_type for p in f.params])
+    # Filter out builtins.
+    tys -= _BUILTIN_MBT
+    # Sort once to keep output stable; the writers expect sorted input.
+    funcs = [uniq[name] for name in sorted(uniq)]
+    types = sorted(tys)
+    # The writers are independent; run them concurrently so file writes
+    # overlap with building the next output. Threads rather than processes:
+    # each output takes milliseconds, far less than spawning and pickling
+    # inputs for a worker process.
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        futs = [
+            ex.submit(write_all, funcs, types, enum_types, typedef_primitives),
+            ex.submit(write_webgpu_consts, combined_text, line_decls, typedef_primitives),
+        ]
+        for fut in futs:
+            fut.result()
+
+    CACHE_FILE.write_text(cache_json(input_hash, REPO, OUTPUTS), encoding="utf-8")
 
 
 if __name__ == "__main__":
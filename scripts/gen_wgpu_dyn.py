@@ -6,6 +6,16 @@ from pathlib import Path
 
 RE_EXPORT_START = re.compile(r"^WGPU_EXPORT\b")
 RE_WGPU_START = re.compile(r"^\s*[A-Za-z_].*\bwgpu[A-Za-z0-9_]+\s*\(.*$")
+RE_FUNC_NAME = re.compile(r"\b(wgpu[A-Za-z0-9_]+)\s*\(")
+
+
+# Cheap substring checks reject almost every header line before the regex runs.
+def _is_export_start(line: str) -> bool:
+  return line.startswith("WGPU_EXPORT") and RE_EXPORT_START.match(line) is not None
+
+
+def _is_wgpu_start(line: str) -> bool:
+  return "wgpu" in line and RE_WGPU_START.match(line) is not None
 
 
 def _collect_multiline_protos(lines: list[str], is_start) -> list[str]:
@@ -38,7 +48,7 @@ def _parse_func(proto: str) -> tuple[str, str, str]:
   if not proto.endswith(";"):
     raise ValueError(f"proto does not end with ';': {proto}")
   proto = proto[:-1].strip()
-  m = re.search(r"\b(wgpu[A-Za-z0-9_]+)\s*\(", proto)
+  m = RE_FUNC_NAME.search(proto)
   if not m:
     raise ValueError(f"cannot find function name in: {proto}")
   name = m.group(1)
@@ -127,13 +137,13 @@ def main() -> None:
   wgpu_h = repo / "src/c/wgpu_native_shim.h"
   out_c = repo / "src/c/wgpu_dyn.c"
 
-  webgpu_lines = webgpu_h.read_text().splitlines()
-  webgpu_protos = _collect_multiline_protos(webgpu_lines, lambda l: RE_EXPORT_START.match(l) is not None)
+  webgpu_lines = webgpu_h.read_bytes().decode("utf-8").splitlines()
+  webgpu_protos = _collect_multiline_protos(webgpu_lines, _is_export_start)
   webgpu_protos = [_strip_attrs(p) for p in webgpu_protos]
 
   # wgpu-native extras are declared in wgpu.h (no WGPU_EXPORT).
-  wgpu_lines = wgpu_h.read_text().splitlines()
-  wgpu_protos = _collect_multiline_protos(wgpu_lines, lambda l: RE_WGPU_START.match(l) is not None)
+  wgpu_lines = wgpu_h.read_bytes().decode("utf-8").splitlines()
+  wgpu_protos = _collect_multiline_protos(wgpu_lines, _is_wgpu_start)
   wgpu_protos = [" ".join(p.strip().split()) for p in wgpu_protos]
 
   seen: set[str] = set()
@@ -172,7 +182,7 @@ static void *mbt_wgpu_sym(const char *name) {{
 """
 
   body = "".join(_emit_wrapper(ret, name, args) for (ret, name, args) in funcs)
-  out_c.write_text(header + body)
+  out_c.write_bytes((header + body).encode("utf-8"))
 
   print(f"generated {out_c} ({len(funcs)} functions)")
 
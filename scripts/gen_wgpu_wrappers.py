@@ -19,10 +19,14 @@ This generator is conservative:
 
 from __future__ import annotations
 
+import os
 import re
-from dataclasses import dataclass
+import sys
+from functools import lru_cache
 from pathlib import Path
-from typing import Iterable
+from typing import Callable, Iterable, NamedTuple
+
+from _gen_cache import cache_json, inputs_digest, load_fresh_cache
 
 
 ROOT = Path(__file__).resolve().parents[1]
@@ -32,6 +36,9 @@ WGPU_SPEC_HANDLES = ROOT / "src" / "wgpu_spec_handles.mbt"
 WEBGPU_CAPI = ROOT / "src" / "c" / "webgpu_capi.mbt"
 
 MBTI_C = ROOT / "src" / "c" / "pkg.generated.mbti"
+# Input/output digests (and skipped functions) of the last successful run.
+CACHE_FILE = ROOT / "scripts" / ".gen_wgpu_wrappers.cache.json"
+_OUTPUTS = (WGPU_MBT, WGPU_SPEC_HANDLES)
 
 TYPES_BEGIN = "// --- BEGIN GENERATED WEBGPU HANDLE TYPES ---"
 TYPES_END = "// --- END GENERATED WEBGPU HANDLE TYPES ---"
@@ -45,13 +52,15 @@ SPEC_METHODS_END = "// --- END GENERATED WEBGPU HANDLE METHODS ---"
 
 
 # Handle types that are deliberately hand-written in src/wgpu.mbt.
-SKIP_GENERATED_STRUCTS: set[str] = {
-    "Surface",  # has extra field `layer`
-    "SurfaceTexture",  # wrapper around opaque surface-texture helper
-    "GlobalReport",  # pointer wrapper
-    "InstanceCapabilities",  # not a WebGPU handle
-    "WaitAnyResult",  # not a WebGPU handle
-}
+SKIP_GENERATED_STRUCTS: frozenset[str] = frozenset(
+    {
+        "Surface",  # has extra field `layer`
+        "SurfaceTexture",  # wrapper around opaque surface-texture helper
+        "GlobalReport",  # pointer wrapper
+        "InstanceCapabilities",  # not a WebGPU handle
+        "WaitAnyResult",  # not a WebGPU handle
+    }
+)
 
 # Map "raw handle base name" (without WGPU prefix) to wrapper type name.
 HANDLE_WRAPPER_OVERRIDES: dict[str, str] = {
@@ -67,17 +76,39 @@ UNSUPPORTED_PARAM_TYPES_SUBSTR: tuple[str, ...] = (
     "CallbackInfo",
 )
 
+# Word boundaries inside CamelCase: lower/digit -> upper, and the last capital
+# of an acronym run that starts a new word ("HTTPServer" -> "HTTP_Server").
+_RE_SNAKE_BOUNDARY = re.compile(r"(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])")
+# pub extern "C" fn NAME( ... ) -> RET = "sym"
+_RE_EXTERN_FN = re.compile(
+    r'pub\s+extern\s+"C"\s+fn\s+(?P<name>[A-Za-z0-9_]+)\s*'
+    r"\((?P<params>.*?)\)\s*->\s*(?P<ret>[^=\n]+?)\s*=\s*\"[^\"]+\"",
+    re.S,
+)
+_RE_HANDLE_REFCOUNT_FN = re.compile(r"^wgpu(?P<h>[A-Za-z0-9]+)(AddRef|Release)$")
+_RE_STRUCT = re.compile(
+    r"pub\s+struct\s+(?P<w>[A-Za-z0-9_]+)\s*\{\s*raw\s*:\s*(?P<raw>@c\.[A-Za-z0-9_]+)",
+    re.S,
+)
+_RE_METHOD = re.compile(r"pub\s+fn\s+(?P<t>[A-Za-z0-9_]+)::(?P<m>[A-Za-z0-9_]+)\s*\(")
+
 
-@dataclass(frozen=True)
-class Param:
+class Param(NamedTuple):
     name: str
     ty: str
 
 
-@dataclass(frozen=True)
-class ExternFn:
+class ExternFn(NamedTuple):
     name: str
-    params: list[Param]
+    params: tuple[Param, ...]
+    ret: str
+
+
+class GenMethod(NamedTuple):
+    recv: str
+    name: str
+    # `name : Type` entries, receiver excluded.
+    params: tuple[str, ...]
     ret: str
 
 
@@ -86,14 +117,29 @@ def _read_text(p: Path) -> str:
 
 
 def _write_text(p: Path, s: str) -> None:
-    p.write_text(s, encoding="utf-8")
-
-
+    # Leave byte-identical files untouched so their mtime does not trigger a
+    # downstream rebuild.
+    new = s.encode("utf-8")
+    try:
+        old = p.read_bytes()
+    except FileNotFoundError:
+        old = None
+    if old == new:
+        return
+    # Write a sibling temp file and rename it over `p`, so an interrupted run
+    # never leaves a truncated .mbt for the next run to parse.
+    tmp = p.with_name(f".{p.name}.tmp")
+    try:
+        tmp.write_bytes(new)
+        os.replace(tmp, p)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+@lru_cache(maxsize=None)
 def _snake_case(name: str) -> str:
     # Handle lowerCamel already.
-    name = re.sub(r"([a-z0-9])([A-Z])", r"\1_\2", name)
-    name = re.sub(r"([A-Z]+)([A-Z][a-z])", r"\1_\2", name)
-    return name.lower()
+    return _RE_SNAKE_BOUNDARY.sub("_", name).lower()
 
 
 def _is_unsupported_type(ty: str) -> bool:
@@ -103,53 +149,47 @@ def _is_unsupported_type(ty: str) -> bool:
 
 
 def _extract_extern_fns_from_webgpu_capi(text: str) -> list[ExternFn]:
-    # Match: pub extern "C" fn NAME( ... ) -> RET = "sym"
     out: list[ExternFn] = []
-    pat = re.compile(
-        r'pub\s+extern\s+"C"\s+fn\s+(?P<name>[A-Za-z0-9_]+)\s*'
-        r"\((?P<params>.*?)\)\s*->\s*(?P<ret>[^=\n]+?)\s*=\s*\"[^\"]+\"",
-        re.S,
-    )
-    for m in pat.finditer(text):
+    for m in _RE_EXTERN_FN.finditer(text):
         name = m.group("name")
         params_blob = m.group("params")
         ret = m.group("ret").strip()
 
+        # `name : Type` pairs; types are plain identifiers (no nested commas).
         params: list[Param] = []
-        for pm in re.finditer(r"(?P<name>[A-Za-z0-9_]+)\s*:\s*(?P<ty>[A-Za-z0-9_]+)", params_blob):
-            params.append(Param(pm.group("name"), pm.group("ty")))
+        for part in params_blob.split(","):
+            pname, sep, ty = part.partition(":")
+            if sep:
+                params.append(Param(pname.strip(), ty.strip()))
 
-        out.append(ExternFn(name=name, params=params, ret=ret))
+        out.append(ExternFn(name, tuple(params), ret))
     return out
 
 
-def _handle_types_from_fns(fns: Iterable[ExternFn]) -> set[str]:
-    # Identify handle types from AddRef/Release.
+def _handle_types_from_fns(fns: Iterable[ExternFn]) -> frozenset[str]:
+    # Identify handle types from AddRef/Release. Names are interned: they are
+    # looked up against every extern fn's param types.
     handles: set[str] = set()
     for f in fns:
-        m = re.match(r"^wgpu(?P<h>[A-Za-z0-9]+)(AddRef|Release)$", f.name)
+        m = _RE_HANDLE_REFCOUNT_FN.match(f.name)
         if m:
-            handles.add("WGPU" + m.group("h"))
-    return handles
+            handles.add(sys.intern("WGPU" + m.group("h")))
+    return frozenset(handles)
 
 
 def _parse_existing_wrapper_structs(wgpu_mbt_text: str) -> dict[str, str]:
     # returns mapping raw_type -> wrapper_name
     # raw_type includes "@c." prefix.
     out: dict[str, str] = {}
-    for m in re.finditer(
-        r"pub\s+struct\s+(?P<w>[A-Za-z0-9_]+)\s*\{\s*raw\s*:\s*(?P<raw>@c\.[A-Za-z0-9_]+)",
-        wgpu_mbt_text,
-        re.S,
-    ):
-        out[m.group("raw")] = m.group("w")
+    for m in _RE_STRUCT.finditer(wgpu_mbt_text):
+        out[sys.intern(m.group("raw"))] = sys.intern(m.group("w"))
     return out
 
 
 def _parse_existing_methods(wgpu_mbt_text: str) -> dict[str, set[str]]:
     # mapping wrapper type -> set(method_name)
     out: dict[str, set[str]] = {}
-    for m in re.finditer(r"pub\s+fn\s+(?P<t>[A-Za-z0-9_]+)::(?P<m>[A-Za-z0-9_]+)\s*\(", wgpu_mbt_text):
+    for m in _RE_METHOD.finditer(wgpu_mbt_text):
         out.setdefault(m.group("t"), set()).add(m.group("m"))
     return out
 
@@ -160,28 +200,26 @@ def _wrapper_name_for_handle_type(wgpu_handle_ty: str) -> str:
     return HANDLE_WRAPPER_OVERRIDES.get(base, base)
 
 
-def _replace_marked_section(text: str, begin: str, end: str, new_inner: str) -> str:
-    b = text.find(begin)
-    e = text.find(end)
-    if b == -1 or e == -1 or e < b:
-        raise RuntimeError(f"missing or invalid markers: {begin} / {end}")
-    # Find the line break after begin marker line.
-    b_line_end = text.find("\n", b)
-    if b_line_end == -1:
-        raise RuntimeError("begin marker is not followed by newline")
-    e_line_start = text.rfind("\n", 0, e)
-    if e_line_start == -1:
-        raise RuntimeError("end marker is not preceded by newline")
+@lru_cache(maxsize=None)
+def _marked_section_re(begin: str, end: str) -> re.Pattern[str]:
+    # Group "inner" spans from the line after the begin marker up to the start
+    # of the line holding the (first following) end marker.
+    return re.compile(
+        re.escape(begin) + r"[^\n]*\n(?P<inner>.*?)(?<=\n)[^\n]*?" + re.escape(end),
+        re.S,
+    )
 
-    return text[: b_line_end + 1] + new_inner + text[e_line_start + 1 :]
 
+def _replace_marked_section(text: str, begin: str, end: str, new_inner: str) -> str:
+    m = _marked_section_re(begin, end).search(text)
+    if m is None:
+        raise RuntimeError(f"missing or invalid markers: {begin} / {end}")
+    return "".join((text[: m.start("inner")], new_inner, text[m.end("inner") :]))
 
-def _gen_structs(handle_types: set[str], existing_structs: dict[str, str]) -> str:
-    # existing_structs maps "@c.RawType" -> WrapperName; we want existing wrapper names.
-    existing_wrapper_names = set(existing_structs.values())
 
-    blocks: list[str] = []
-    for h in sorted(handle_types):
+def _gen_structs(sorted_handles: list[str], existing_wrapper_names: frozenset[str]) -> str:
+    lines: list[str] = []
+    for h in sorted_handles:
         wrapper = _wrapper_name_for_handle_type(h)
         if wrapper in SKIP_GENERATED_STRUCTS:
             continue
@@ -189,24 +227,15 @@ def _gen_structs(handle_types: set[str], existing_structs: dict[str, str]) -> st
             continue
         # Most handles are exposed in the c package via #alias(<BaseName>).
         raw_ty = "@c." + wrapper
-        blocks.append(
-            "\n".join(
-                [
-                    "///|",
-                    f"pub struct {wrapper} {{",
-                    f"  raw : {raw_ty}",
-                    "}",
-                ]
-            )
-        )
+        lines.extend(("///|", f"pub struct {wrapper} {{", f"  raw : {raw_ty}", "}"))
 
-    if not blocks:
+    if not lines:
         return ""
-    return "\n".join(blocks) + "\n"
+    return "\n".join(lines) + "\n"
 
 
 def _mbt_type_for_param(
-    ty: str, handle_types: set[str], existing_structs: dict[str, str]
+    ty: str, handle_types: frozenset[str], existing_structs: dict[str, str]
 ) -> tuple[str, bool]:
     """
     Returns (type_in_signature, is_handle_wrapper)
@@ -223,7 +252,7 @@ def _mbt_type_for_param(
 
 
 def _mbt_type_for_return(
-    ty: str, handle_types: set[str], existing_structs: dict[str, str]
+    ty: str, handle_types: frozenset[str], existing_structs: dict[str, str]
 ) -> tuple[str, str | None]:
     """
     Returns (type_in_signature, wrapper_name_if_handle)
@@ -238,348 +267,310 @@ def _mbt_type_for_return(
     return ty, None
 
 
+def _method_lines(m: GenMethod, body: str) -> tuple[str, ...]:
+    return (
+        "///|",
+        f"pub fn {m.recv}::{m.name}(",
+        "  " + ",\n  ".join((f"self : {m.recv}", *m.params)) + ",",
+        f") -> {m.ret} {{",
+        body,
+        "}",
+    )
+
+
+# Special cases: methods generated as replacements for otherwise-unsupported C
+# signatures. A handler gets the receiver wrapper name, the receiver's
+# already-used method names and a `(recv, desired) -> name` allocator. It
+# returns the `(method, body)` pairs to emit -- an empty list when the API is
+# already covered by an existing MoonBit method (possibly under a different
+# name) -- or None to fall back to the default generator.
+_SpecialResult = list[tuple[GenMethod, str]]
+_SpecialCase = Callable[[str, "set[str]", Callable[[str, str], str]], "_SpecialResult | None"]
+
+
+class _MethodTmpl(NamedTuple):
+    # str.format templates for the non-receiver params, return type and body.
+    params: tuple[str, ...]
+    ret: str
+    body: str
+
+
+_LABEL_TMPL = _MethodTmpl(
+    ("label : String",),
+    "Unit",
+    "  let bytes = label.to_bytes()\n"
+    "  @c.{helper}(self.raw, bytes, bytes.length().to_uint64())",
+)
+_SET_BIND_GROUP_TMPL = _MethodTmpl(
+    ("index : UInt", "group : BindGroup", "dynamic_offsets : Array[UInt]"),
+    "Unit",
+    "  @c.{helper}(self.raw, index, group.raw, dynamic_offsets)",
+)
+_PUSH_CONSTANTS_TMPL = _MethodTmpl(
+    ("offset : UInt", "data : Bytes"),
+    "Unit",
+    "  @c.{helper}(\n"
+    "    self.raw,\n"
+    "    offset,\n"
+    "    data,\n"
+    "    data.length().to_uint64(),\n"
+    "  )",
+)
+_PUSH_CONSTANTS_STAGES_TMPL = _MethodTmpl(
+    ("stages : UInt64", "offset : UInt", "data : Bytes"),
+    "Unit",
+    "  @c.{helper}(\n"
+    "    self.raw,\n"
+    "    stages,\n"
+    "    offset,\n"
+    "    data,\n"
+    "    data.length().to_uint64(),\n"
+    "  )",
+)
+# Receiver wrapper -> (template, @c helper) for SetPushConstants.
+_PUSH_CONSTANTS_CASES: dict[str, tuple[_MethodTmpl, str]] = {
+    "ComputePass": (_PUSH_CONSTANTS_TMPL, "compute_pass_set_push_constants_bytes"),
+    "RenderPass": (_PUSH_CONSTANTS_STAGES_TMPL, "render_pass_set_push_constants_bytes"),
+    "RenderBundleEncoder": (
+        _PUSH_CONSTANTS_STAGES_TMPL,
+        "render_bundle_encoder_set_push_constants_bytes",
+    ),
+}
+_REQUEST_ADAPTER_TMPL = _MethodTmpl(
+    ("options : @c.WGPURequestAdapterOptionsPtr",),
+    "Adapter",
+    "  Adapter::{{ raw: @c.instance_request_adapter_sync_ptr(self.raw, options) }}",
+)
+_REQUEST_DEVICE_TMPL = _MethodTmpl(
+    ("instance : Instance", "descriptor : @c.WGPUDeviceDescriptorPtr"),
+    "Device",
+    "  Device::{{ raw: @c.adapter_request_device_sync_ptr(instance.raw, self.raw, descriptor) }}",
+)
+# `instance`-taking sync helpers that return a UInt status.
+_SYNC_U32_TMPL = _MethodTmpl(
+    ("instance : Instance",),
+    "UInt",
+    "  @c.{helper}(instance.raw, self.raw)",
+)
+_CREATE_PIPELINE_ASYNC_TMPL = _MethodTmpl(
+    ("instance : Instance", "descriptor : @c.{descriptor}"),
+    "{pipeline}",
+    "  {pipeline}::{{\n"
+    "    raw: @c.{helper}(\n"
+    "      instance.raw,\n"
+    "      self.raw,\n"
+    "      descriptor,\n"
+    "    ),\n"
+    "  }}",
+)
+
+
+def _emit_once(
+    recv: str,
+    used: set[str],
+    alloc: Callable[[str, str], str],
+    desired: str,
+    tmpl: _MethodTmpl,
+    **fields: str,
+) -> _SpecialResult:
+    if desired in used:
+        return []
+    m = GenMethod(
+        recv,
+        alloc(recv, desired),
+        tuple(p.format(**fields) for p in tmpl.params),
+        tmpl.ret.format(**fields),
+    )
+    return [(m, tmpl.body.format(**fields))]
+
+
+def _label_case(desired: str, helper_suffix: str) -> _SpecialCase:
+    # WGPUStringView: route label/debug-marker APIs through existing *_utf8 helpers.
+    def handler(
+        recv: str, used: set[str], alloc: Callable[[str, str], str]
+    ) -> _SpecialResult | None:
+        helper = f"{_snake_case(recv)}_{helper_suffix}"
+        return _emit_once(recv, used, alloc, desired, _LABEL_TMPL, helper=helper)
+
+    return handler
+
+
+def _set_bind_group_case(
+    recv: str, used: set[str], alloc: Callable[[str, str], str]
+) -> _SpecialResult | None:
+    # Dynamic bind-group offsets: use Array[UInt] helpers in @c.
+    helper = f"{_snake_case(recv)}_set_bind_group"
+    return _emit_once(recv, used, alloc, "set_bind_group", _SET_BIND_GROUP_TMPL, helper=helper)
+
+
+def _set_push_constants_case(
+    recv: str, used: set[str], alloc: Callable[[str, str], str]
+) -> _SpecialResult | None:
+    # Push-constants: route UnitPtr+size to borrowed Bytes helpers.
+    if "set_push_constants" in used:
+        return []
+    case = _PUSH_CONSTANTS_CASES.get(recv)
+    if case is None:
+        return None
+    tmpl, helper = case
+    return _emit_once(recv, used, alloc, "set_push_constants", tmpl, helper=helper)
+
+
+def _covered_by(*methods: str) -> _SpecialCase:
+    # The API is covered once all of `methods` exist; otherwise fall back.
+    def handler(
+        recv: str, used: set[str], alloc: Callable[[str, str], str]
+    ) -> _SpecialResult | None:
+        return [] if all(m in used for m in methods) else None
+
+    return handler
+
+
+def _sync_case(desired: str, tmpl: _MethodTmpl, **fields: str) -> _SpecialCase:
+    # CallbackInfo/Future-style APIs: treat as covered by existing sync helpers,
+    # or generate minimal sync variants when missing.
+    def handler(
+        recv: str, used: set[str], alloc: Callable[[str, str], str]
+    ) -> _SpecialResult | None:
+        return _emit_once(recv, used, alloc, desired, tmpl, **fields)
+
+    return handler
+
+
+# Dispatch on the operation name (function name minus `wgpu<Handle>`) ...
+_OP_SPECIAL_CASES: dict[str, _SpecialCase] = {
+    "SetLabel": _label_case("set_label", "set_label_utf8"),
+    "InsertDebugMarker": _label_case("insert_debug_marker", "insert_debug_marker_utf8"),
+    "PushDebugGroup": _label_case("push_debug_group", "push_debug_group_utf8"),
+    "SetBindGroup": _set_bind_group_case,
+    "SetPushConstants": _set_push_constants_case,
+}
+# ... or on the full C function name.
+_FN_SPECIAL_CASES: dict[str, _SpecialCase] = {
+    # Queue writes: our public API already exposes Bytes-based wrappers.
+    "wgpuQueueWriteBuffer": _covered_by("write_buffer"),
+    "wgpuQueueWriteTexture": _covered_by("write_texture_ptr"),
+    "wgpuInstanceRequestAdapter": _sync_case("request_adapter_sync_ptr", _REQUEST_ADAPTER_TMPL),
+    "wgpuAdapterRequestDevice": _sync_case("request_device_sync_ptr", _REQUEST_DEVICE_TMPL),
+    "wgpuQueueOnSubmittedWorkDone": _sync_case(
+        "on_submitted_work_done_sync",
+        _SYNC_U32_TMPL,
+        helper="queue_on_submitted_work_done_sync",
+    ),
+    "wgpuDevicePopErrorScope": _sync_case(
+        "pop_error_scope_sync",
+        _SYNC_U32_TMPL,
+        helper="device_pop_error_scope_sync_u32",
+    ),
+    "wgpuDeviceCreateComputePipelineAsync": _sync_case(
+        "create_compute_pipeline_async_sync_ptr",
+        _CREATE_PIPELINE_ASYNC_TMPL,
+        descriptor="WGPUComputePipelineDescriptorPtr",
+        pipeline="ComputePipeline",
+        helper="device_create_compute_pipeline_async_sync_ptr",
+    ),
+    "wgpuDeviceCreateRenderPipelineAsync": _sync_case(
+        "create_render_pipeline_async_sync_ptr",
+        _CREATE_PIPELINE_ASYNC_TMPL,
+        descriptor="WGPURenderPipelineDescriptorPtr",
+        pipeline="RenderPipeline",
+        helper="device_create_render_pipeline_async_sync_ptr",
+    ),
+    "wgpuShaderModuleGetCompilationInfo": _sync_case(
+        "get_compilation_info_sync_status_u32",
+        _SYNC_U32_TMPL,
+        helper="shader_module_get_compilation_info_sync_status_u32",
+    ),
+    # Buffer mapping and mapped-range access are already covered by our
+    # safe sync helpers (map_{read,write}_sync + unmap).
+    "wgpuBufferMapAsync": _covered_by("map_read_sync", "map_write_sync"),
+    "wgpuBufferGetConstMappedRange": _covered_by("map_read_sync", "map_write_sync"),
+    "wgpuBufferGetMappedRange": _covered_by("map_read_sync", "map_write_sync"),
+}
+
+
 def _gen_methods(
     fns: list[ExternFn],
-    handle_types: set[str],
+    handle_types: frozenset[str],
     existing_structs: dict[str, str],
     existing_methods: dict[str, set[str]],
-) -> tuple[str, list[str]]:
-    blocks: list[str] = []
+    existing_wrapper_names: frozenset[str],
+) -> tuple[str, list[GenMethod], list[str]]:
+    # Blocks are emitted line by line into one flat list and joined once.
+    lines: list[str] = []
+    methods: list[GenMethod] = []
     skipped: list[str] = []
 
     # Only generate methods when the receiver wrapper exists (hand-written or generated types).
-    # Compute wrapper names that exist.
-    existing_wrapper_names = set(existing_structs.values())
     # Add potential generated ones: those we would generate, not including skipped special cases.
+    wrapper_names = set(existing_wrapper_names)
     for h in handle_types:
         w = _wrapper_name_for_handle_type(h)
         if w not in SKIP_GENERATED_STRUCTS:
-            existing_wrapper_names.add(w)
+            wrapper_names.add(w)
+
+    # Signature types depend only on the C type for the whole run; resolve each
+    # distinct one once.
+    param_types = {
+        ty: _mbt_type_for_param(ty, handle_types, existing_structs)
+        for ty in {p.ty for f in fns for p in f.params}
+    }
+    return_types = {
+        ty: _mbt_type_for_return(ty, handle_types, existing_structs) for ty in {f.ret for f in fns}
+    }
+
+    # Used-name sets are updated in place. `raw_depth` remembers how many
+    # `_raw` suffixes a (receiver, name) pair already needed, so repeated
+    # collisions resume from there instead of rescanning.
+    raw_depth: dict[tuple[str, str], int] = {}
 
     def _alloc_method_name(recv_wrapper: str, desired: str) -> str:
-        used = existing_methods.get(recv_wrapper, set())
-        mname = desired
+        used = existing_methods.setdefault(recv_wrapper, set())
+        key = (recv_wrapper, desired)
+        depth = raw_depth.get(key, 0)
+        mname = desired + "_raw" * depth
         while mname in used:
-            mname = mname + "_raw"
-        used = set(used)
+            depth += 1
+            mname += "_raw"
+        raw_depth[key] = depth
         used.add(mname)
-        existing_methods[recv_wrapper] = used
         return mname
 
-    def _special_case(
-        f: ExternFn,
-        recv_wrapper: str,
-        op_camel: str,
-    ) -> str | None:
-        """
-        Return a full method block string if we should generate a replacement
-        method for an otherwise-unsupported C signature. Return None to fall
-        back to the default generator. If the API is already covered by an
-        existing MoonBit method (possibly under a different name), return the
-        empty string "" to indicate "covered, do not skip and do not generate".
-        """
-        used = existing_methods.get(recv_wrapper, set())
-
-        # WGPUStringView: route label/debug-marker APIs through existing *_utf8 helpers.
-        if op_camel in {"SetLabel", "InsertDebugMarker", "PushDebugGroup"}:
-            desired = {
-                "SetLabel": "set_label",
-                "InsertDebugMarker": "insert_debug_marker",
-                "PushDebugGroup": "push_debug_group",
-            }[op_camel]
-            if desired in used:
-                return ""
-
-            helper_suffix = {
-                "SetLabel": "set_label_utf8",
-                "InsertDebugMarker": "insert_debug_marker_utf8",
-                "PushDebugGroup": "push_debug_group_utf8",
-            }[op_camel]
-            helper = f"{_snake_case(recv_wrapper)}_{helper_suffix}"
-            mname = _alloc_method_name(recv_wrapper, desired)
-            return "\n".join(
-                [
-                    "///|",
-                    f"pub fn {recv_wrapper}::{mname}(",
-                    f"  self : {recv_wrapper},",
-                    "  label : String,",
-                    ") -> Unit {",
-                    "  let bytes = label.to_bytes()",
-                    f"  @c.{helper}(self.raw, bytes, bytes.length().to_uint64())",
-                    "}",
-                ]
-            )
-
-        # Dynamic bind-group offsets: use Array[UInt] helpers in @c.
-        if op_camel == "SetBindGroup":
-            desired = "set_bind_group"
-            if desired in used:
-                return ""
-            helper = f"{_snake_case(recv_wrapper)}_set_bind_group"
-            mname = _alloc_method_name(recv_wrapper, desired)
-            return "\n".join(
-                [
-                    "///|",
-                    f"pub fn {recv_wrapper}::{mname}(",
-                    f"  self : {recv_wrapper},",
-                    "  index : UInt,",
-                    "  group : BindGroup,",
-                    "  dynamic_offsets : Array[UInt],",
-                    ") -> Unit {",
-                    f"  @c.{helper}(self.raw, index, group.raw, dynamic_offsets)",
-                    "}",
-                ]
-            )
-
-        # Push-constants: route UnitPtr+size to borrowed Bytes helpers.
-        if op_camel == "SetPushConstants":
-            desired = "set_push_constants"
-            if desired in used:
-                return ""
-
-            if recv_wrapper == "ComputePass":
-                mname = _alloc_method_name(recv_wrapper, desired)
-                return "\n".join(
-                    [
-                        "///|",
-                        f"pub fn {recv_wrapper}::{mname}(",
-                        f"  self : {recv_wrapper},",
-                        "  offset : UInt,",
-                        "  data : Bytes,",
-                        ") -> Unit {",
-                        "  @c.compute_pass_set_push_constants_bytes(",
-                        "    self.raw,",
-                        "    offset,",
-                        "    data,",
-                        "    data.length().to_uint64(),",
-                        "  )",
-                        "}",
-                    ]
-                )
-            if recv_wrapper == "RenderPass":
-                mname = _alloc_method_name(recv_wrapper, desired)
-                return "\n".join(
-                    [
-                        "///|",
-                        f"pub fn {recv_wrapper}::{mname}(",
-                        f"  self : {recv_wrapper},",
-                        "  stages : UInt64,",
-                        "  offset : UInt,",
-                        "  data : Bytes,",
-                        ") -> Unit {",
-                        "  @c.render_pass_set_push_constants_bytes(",
-                        "    self.raw,",
-                        "    stages,",
-                        "    offset,",
-                        "    data,",
-                        "    data.length().to_uint64(),",
-                        "  )",
-                        "}",
-                    ]
-                )
-            if recv_wrapper == "RenderBundleEncoder":
-                mname = _alloc_method_name(recv_wrapper, desired)
-                return "\n".join(
-                    [
-                        "///|",
-                        f"pub fn {recv_wrapper}::{mname}(",
-                        f"  self : {recv_wrapper},",
-                        "  stages : UInt64,",
-                        "  offset : UInt,",
-                        "  data : Bytes,",
-                        ") -> Unit {",
-                        "  @c.render_bundle_encoder_set_push_constants_bytes(",
-                        "    self.raw,",
-                        "    stages,",
-                        "    offset,",
-                        "    data,",
-                        "    data.length().to_uint64(),",
-                        "  )",
-                        "}",
-                    ]
-                )
-
-        # Queue writes: our public API already exposes Bytes-based wrappers.
-        if f.name == "wgpuQueueWriteBuffer":
-            if "write_buffer" in used:
-                return ""
-        if f.name == "wgpuQueueWriteTexture":
-            if "write_texture_ptr" in used:
-                return ""
-
-        # CallbackInfo/Future-style APIs: treat as covered by existing sync helpers,
-        # or generate minimal sync variants when missing.
-        if f.name == "wgpuInstanceRequestAdapter":
-            desired = "request_adapter_sync_ptr"
-            if desired in used:
-                return ""
-            mname = _alloc_method_name(recv_wrapper, desired)
-            return "\n".join(
-                [
-                    "///|",
-                    f"pub fn {recv_wrapper}::{mname}(",
-                    f"  self : {recv_wrapper},",
-                    "  options : @c.WGPURequestAdapterOptionsPtr,",
-                    ") -> Adapter {",
-                    "  Adapter::{ raw: @c.instance_request_adapter_sync_ptr(self.raw, options) }",
-                    "}",
-                ]
-            )
-
-        if f.name == "wgpuAdapterRequestDevice":
-            desired = "request_device_sync_ptr"
-            if desired in used:
-                return ""
-            mname = _alloc_method_name(recv_wrapper, desired)
-            return "\n".join(
-                [
-                    "///|",
-                    f"pub fn {recv_wrapper}::{mname}(",
-                    f"  self : {recv_wrapper},",
-                    "  instance : Instance,",
-                    "  descriptor : @c.WGPUDeviceDescriptorPtr,",
-                    ") -> Device {",
-                    "  Device::{ raw: @c.adapter_request_device_sync_ptr(instance.raw, self.raw, descriptor) }",
-                    "}",
-                ]
-            )
-
-        if f.name == "wgpuQueueOnSubmittedWorkDone":
-            desired = "on_submitted_work_done_sync"
-            if desired in used:
-                return ""
-            mname = _alloc_method_name(recv_wrapper, desired)
-            return "\n".join(
-                [
-                    "///|",
-                    f"pub fn {recv_wrapper}::{mname}(",
-                    f"  self : {recv_wrapper},",
-                    "  instance : Instance,",
-                    ") -> UInt {",
-                    "  @c.queue_on_submitted_work_done_sync(instance.raw, self.raw)",
-                    "}",
-                ]
-            )
-
-        if f.name == "wgpuDevicePopErrorScope":
-            desired = "pop_error_scope_sync"
-            if desired in used:
-                return ""
-            mname = _alloc_method_name(recv_wrapper, desired)
-            return "\n".join(
-                [
-                    "///|",
-                    f"pub fn {recv_wrapper}::{mname}(",
-                    f"  self : {recv_wrapper},",
-                    "  instance : Instance,",
-                    ") -> UInt {",
-                    "  @c.device_pop_error_scope_sync_u32(instance.raw, self.raw)",
-                    "}",
-                ]
-            )
-
-        if f.name == "wgpuDeviceCreateComputePipelineAsync":
-            desired = "create_compute_pipeline_async_sync_ptr"
-            if desired in used:
-                return ""
-            mname = _alloc_method_name(recv_wrapper, desired)
-            return "\n".join(
-                [
-                    "///|",
-                    f"pub fn {recv_wrapper}::{mname}(",
-                    f"  self : {recv_wrapper},",
-                    "  instance : Instance,",
-                    "  descriptor : @c.WGPUComputePipelineDescriptorPtr,",
-                    ") -> ComputePipeline {",
-                    "  ComputePipeline::{",
-                    "    raw: @c.device_create_compute_pipeline_async_sync_ptr(",
-                    "      instance.raw,",
-                    "      self.raw,",
-                    "      descriptor,",
-                    "    ),",
-                    "  }",
-                    "}",
-                ]
-            )
-
-        if f.name == "wgpuDeviceCreateRenderPipelineAsync":
-            desired = "create_render_pipeline_async_sync_ptr"
-            if desired in used:
-                return ""
-            mname = _alloc_method_name(recv_wrapper, desired)
-            return "\n".join(
-                [
-                    "///|",
-                    f"pub fn {recv_wrapper}::{mname}(",
-                    f"  self : {recv_wrapper},",
-                    "  instance : Instance,",
-                    "  descriptor : @c.WGPURenderPipelineDescriptorPtr,",
-                    ") -> RenderPipeline {",
-                    "  RenderPipeline::{",
-                    "    raw: @c.device_create_render_pipeline_async_sync_ptr(",
-                    "      instance.raw,",
-                    "      self.raw,",
-                    "      descriptor,",
-                    "    ),",
-                    "  }",
-                    "}",
-                ]
-            )
-
-        if f.name == "wgpuShaderModuleGetCompilationInfo":
-            desired = "get_compilation_info_sync_status_u32"
-            if desired in used:
-                return ""
-            mname = _alloc_method_name(recv_wrapper, desired)
-            return "\n".join(
-                [
-                    "///|",
-                    f"pub fn {recv_wrapper}::{mname}(",
-                    f"  self : {recv_wrapper},",
-                    "  instance : Instance,",
-                    ") -> UInt {",
-                    "  @c.shader_module_get_compilation_info_sync_status_u32(instance.raw, self.raw)",
-                    "}",
-                ]
-            )
-
-        # Buffer mapping and mapped-range access are already covered by our
-        # safe sync helpers (map_{read,write}_sync + unmap).
-        if f.name in {
-            "wgpuBufferMapAsync",
-            "wgpuBufferGetConstMappedRange",
-            "wgpuBufferGetMappedRange",
-        }:
-            if "map_read_sync" in used and "map_write_sync" in used:
-                return ""
-
-        return None
+    # Handle type -> (receiver wrapper, C function name prefix), resolved once.
+    # The receiver comes from the first param, not the name: e.g.
+    # wgpuGenerateReport takes a WGPUInstance and becomes an Instance method.
+    receivers = {
+        h: (_wrapper_name_for_handle_type(h), "wgpu" + h.removeprefix("WGPU"))
+        for h in handle_types
+    }
 
     for f in fns:
-        if not f.name.startswith("wgpu"):
-            continue
-        if not f.params:
+        if not f.params or not f.name.startswith("wgpu"):
             continue
-        recv_ty = f.params[0].ty
-        if recv_ty not in handle_types:
+        recv = receivers.get(f.params[0].ty)
+        if recv is None:
             continue
 
-        recv_wrapper = _wrapper_name_for_handle_type(recv_ty)
-        if recv_wrapper not in existing_wrapper_names:
+        recv_wrapper, prefix = recv
+        if recv_wrapper not in wrapper_names:
             skipped.append(f.name)
             continue
 
-        base = recv_ty.removeprefix("WGPU")
-        op_camel = f.name.removeprefix("wgpu" + base)
+        op_camel = f.name.removeprefix(prefix)
         if not op_camel:
             skipped.append(f.name)
             continue
         method = _snake_case(op_camel)
 
-        special = _special_case(f, recv_wrapper, op_camel)
+        handler = _OP_SPECIAL_CASES.get(op_camel) or _FN_SPECIAL_CASES.get(f.name)
+        special = None
+        if handler is not None:
+            used = existing_methods.get(recv_wrapper, set())
+            special = handler(recv_wrapper, used, _alloc_method_name)
         if special is not None:
-            if special != "":
-                blocks.append(special)
+            for m, body in special:
+                methods.append(m)
+                lines.extend(_method_lines(m, body))
             continue
 
         # Skip signatures that mention by-value struct types.
@@ -591,134 +582,134 @@ def _gen_methods(
         mname = _alloc_method_name(recv_wrapper, method)
 
         # Params (skip receiver)
-        sig_params: list[str] = [f"self : {recv_wrapper}"]
+        sig_params: list[str] = []
         call_args: list[str] = ["self.raw"]
         for p in f.params[1:]:
             pname = _snake_case(p.name)
             if pname == "self":
                 pname = "arg_self"
-            pty, is_handle = _mbt_type_for_param(p.ty, handle_types, existing_structs)
+            pty, is_handle = param_types[p.ty]
             sig_params.append(f"{pname} : {pty}")
             call_args.append(f"{pname}.raw" if is_handle else pname)
 
-        ret_ty, ret_wrapper = _mbt_type_for_return(f.ret, handle_types, existing_structs)
+        ret_ty, ret_wrapper = return_types[f.ret]
 
         call = f"@c.{f.name}(" + ", ".join(call_args) + ")"
-        if ret_ty == "Unit":
-            body = "\n".join([call])
+        if ret_ty == "Unit" or ret_wrapper is None:
+            body = call
+        elif ret_wrapper == "Surface":
+            body = f"Surface::{{ raw: {call}, layer: @c.null_opaque_ptr() }}"
         else:
-            if ret_wrapper is None:
-                body = "\n".join([call])
-            else:
-                if ret_wrapper == "Surface":
-                    body = f"Surface::{{ raw: {call}, layer: @c.null_opaque_ptr() }}"
-                else:
-                    body = f"{ret_wrapper}::{{ raw: {call} }}"
-
-        blocks.append(
-            "\n".join(
-                [
-                    "///|",
-                    f"pub fn {recv_wrapper}::{mname}(",
-                    "  " + ",\n  ".join(sig_params) + ",",
-                    f") -> {ret_ty} {{",
-                    f"  {body}",
-                    "}",
-                ]
-            )
-        )
+            body = f"{ret_wrapper}::{{ raw: {call} }}"
+
+        m = GenMethod(recv_wrapper, mname, tuple(sig_params), ret_ty)
+        methods.append(m)
+        lines.extend(_method_lines(m, f"  {body}"))
 
-    if not blocks:
-        return "", skipped
-    return "\n".join(blocks) + "\n", skipped
+    if not lines:
+        return "", methods, skipped
+    return "\n".join(lines) + "\n", methods, skipped
 
 
-def _gen_spec_types(handle_types: set[str], existing_structs: dict[str, str]) -> str:
-    existing_wrapper_names = set(existing_structs.values())
-    blocks: list[str] = []
-    for h in sorted(handle_types):
+def _gen_spec_types(sorted_handles: list[str], existing_wrapper_names: frozenset[str]) -> str:
+    lines: list[str] = []
+    for h in sorted_handles:
         w = _wrapper_name_for_handle_type(h)
         if w in SKIP_GENERATED_STRUCTS:
             continue
         if w in existing_wrapper_names:
             continue
-        blocks.append("\n".join(["///|", "#declaration_only", f"pub type {w}"]))
-    if not blocks:
+        lines.extend(("///|", "#declaration_only", f"pub type {w}"))
+    if not lines:
         return ""
-    return "\n".join(blocks) + "\n"
-
-
-def _gen_spec_methods(generated_methods_mbt: str) -> str:
-    # Transform `pub fn T::m(...)->R { ... }` to `declare pub fn ...` in spec file.
-    blocks: list[str] = []
-    pat = re.compile(
-        r"pub\s+fn\s+(?P<t>[A-Za-z0-9_]+)::(?P<m>[A-Za-z0-9_]+)\s*"
-        r"\((?P<params>.*?)\)\s*->\s*(?P<ret>[A-Za-z0-9_@\.\[\]]+)\s*\{",
-        re.S,
-    )
-    for m in pat.finditer(generated_methods_mbt):
-        t = m.group("t")
-        fn = m.group("m")
-        params_blob = m.group("params")
-        ret = m.group("ret").strip()
-
-        # Parse params and drop `self`.
-        params: list[str] = []
-        for pm in re.finditer(
-            r"(?P<name>[A-Za-z0-9_]+)\s*:\s*(?P<ty>[A-Za-z0-9_@\.\[\]]+)",
-            params_blob,
-        ):
-            name = pm.group("name")
-            ty = pm.group("ty")
-            if name == "self":
-                continue
-            params.append(f"{name} : {ty}")
-
-        sig = ",\n  ".join([f"self : {t}"] + params)
-        blocks.append(
-            "\n".join(
-                [
-                    "///|",
-                    "#declaration_only",
-                    f"declare pub fn {t}::{fn}(",
-                    f"  {sig},",
-                    f") -> {ret}",
-                ]
+    return "\n".join(lines) + "\n"
+
+
+def _gen_spec_methods(methods: Iterable[GenMethod]) -> str:
+    # Declare each generated `pub fn T::m(...) -> R { ... }` in the spec file.
+    lines: list[str] = []
+    for m in methods:
+        sig = ",\n  ".join((f"self : {m.recv}", *m.params))
+        lines.extend(
+            (
+                "///|",
+                "#declaration_only",
+                f"declare pub fn {m.recv}::{m.name}(",
+                f"  {sig},",
+                f") -> {m.ret}",
             )
         )
 
-    if not blocks:
+    if not lines:
         return ""
-    return "\n".join(blocks) + "\n"
+    return "\n".join(lines) + "\n"
+
+
+def _report_skipped(skipped: list[str]) -> None:
+    if skipped:
+        # Keep output short but actionable.
+        unique = sorted(set(skipped))
+        lines = [f"skipped {len(unique)} functions (need by-value struct helpers):"]
+        lines.extend(f"- {s}" for s in unique[:50])
+        if len(unique) > 50:
+            lines.append(f"... and {len(unique) - 50} more")
+        sys.stdout.write("\n".join(lines) + "\n")
 
 
 def main() -> int:
-    webgpu_text = _read_text(WEBGPU_CAPI)
+    # The C API bindings and most impl files only feed the input hash until the
+    # cache misses, so keep them as raw bytes and decode them on demand.
+    webgpu_raw = WEBGPU_CAPI.read_bytes()
     wgpu_text = _read_text(WGPU_MBT)
     spec_text = _read_text(WGPU_SPEC_HANDLES)
 
-    fns = _extract_extern_fns_from_webgpu_capi(webgpu_text)
-    handles = _handle_types_from_fns(fns)
-
     # For collision checks, parse the whole package (all src/*.mbt), but exclude
     # the generated sections inside `wgpu_handles.mbt` so repeated generator
     # runs are stable.
-    impl_texts: list[str] = []
+    impl_blobs: list[bytes] = []
     for p in sorted(SRC_DIR.glob("*.mbt")):
         if p.name.startswith("wgpu_spec"):
             continue
-        t = _read_text(p)
         if p.name == WGPU_MBT.name:
-            t = _replace_marked_section(t, TYPES_BEGIN, TYPES_END, "")
+            t = _replace_marked_section(wgpu_text, TYPES_BEGIN, TYPES_END, "")
             t = _replace_marked_section(t, METHODS_BEGIN, METHODS_END, "")
-        impl_texts.append(t)
-    impl_text = "\n".join(impl_texts)
+            impl_blobs.append(t.encode("utf-8"))
+        else:
+            impl_blobs.append(p.read_bytes())
+
+    # Everything the output depends on, minus the generated sections themselves
+    # (those are checked through the output digests instead).
+    spec_hand_written = _replace_marked_section(spec_text, SPEC_TYPES_BEGIN, SPEC_TYPES_END, "")
+    spec_hand_written = _replace_marked_section(
+        spec_hand_written, SPEC_METHODS_BEGIN, SPEC_METHODS_END, ""
+    )
+    input_hash = inputs_digest(
+        Path(__file__).read_bytes(),
+        webgpu_raw,
+        spec_hand_written.encode("utf-8"),
+        *impl_blobs,
+    )
+    cache = load_fresh_cache(CACHE_FILE, input_hash, ROOT, _OUTPUTS)
+    if cache is not None:
+        _report_skipped(cache.get("skipped", []))
+        return 0
+
+    impl_text = b"\n".join(impl_blobs).decode("utf-8")
+
+    fns = _extract_extern_fns_from_webgpu_capi(webgpu_raw.decode("utf-8"))
+    handles = _handle_types_from_fns(fns)
 
     existing_structs = _parse_existing_wrapper_structs(impl_text)
     existing_methods = _parse_existing_methods(impl_text)
 
-    gen_structs = _gen_structs(handles, existing_structs)
-    gen_methods, skipped = _gen_methods(fns, handles, existing_structs, existing_methods)
+    # existing_structs maps "@c.RawType" -> WrapperName; we want existing wrapper names.
+    existing_wrapper_names = frozenset(existing_structs.values())
+    sorted_handles = sorted(handles)
+
+    gen_structs = _gen_structs(sorted_handles, existing_wrapper_names)
+    gen_methods, methods, skipped = _gen_methods(
+        fns, handles, existing_structs, existing_methods, existing_wrapper_names
+    )
 
     # Update src/wgpu.mbt
     wgpu_text = _replace_marked_section(wgpu_text, TYPES_BEGIN, TYPES_END, gen_structs)
@@ -726,21 +717,15 @@ def main() -> int:
     _write_text(WGPU_MBT, wgpu_text)
 
     # Update src/wgpu_spec.mbt
-    spec_types = _gen_spec_types(handles, existing_structs)
-    spec_methods = _gen_spec_methods(gen_methods)
+    spec_types = _gen_spec_types(sorted_handles, existing_wrapper_names)
+    spec_methods = _gen_spec_methods(methods)
     spec_text = _replace_marked_section(spec_text, SPEC_TYPES_BEGIN, SPEC_TYPES_END, spec_types)
     spec_text = _replace_marked_section(spec_text, SPEC_METHODS_BEGIN, SPEC_METHODS_END, spec_methods)
     _write_text(WGPU_SPEC_HANDLES, spec_text)
 
-    if skipped:
-        # Keep output short but actionable.
-        unique = sorted(set(skipped))
-        print(f"skipped {len(unique)} functions (need by-value struct helpers):")
-        for s in unique[:50]:
-            print(f"- {s}")
-        if len(unique) > 50:
-            print(f"... and {len(unique) - 50} more")
+    _write_text(CACHE_FILE, cache_json(input_hash, ROOT, _OUTPUTS, skipped=skipped))
 
+    _report_skipped(skipped)
     return 0
 
 
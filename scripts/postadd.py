@@ -16,8 +16,14 @@ import platform
 import subprocess
 import sys
 import tempfile
+import threading
+import time
+import urllib.error
 import urllib.request
+from concurrent.futures import Future
+from functools import lru_cache
 from pathlib import Path
+from typing import IO
 
 
 REPO = "moonbit-community/wgpu-mbt"
@@ -25,17 +31,46 @@ REPO = "moonbit-community/wgpu-mbt"
 MARKER_PIPELINE_ASYNC = "pipeline_async.ok"
 MARKER_COMPILATION_INFO = "compilation_info.ok"
 
+# Feature probes: (moon package, marker written under the data dir on success).
+_PROBES = (
+  ("src/cmd/probe_pipeline_async", MARKER_PIPELINE_ASYNC),
+  ("src/cmd/probe_compilation_info", MARKER_COMPILATION_INFO),
+)
+
+# Read size for downloads and hashing.
+_DL_CHUNK = 1 << 20
+
+# How long a cached SHA256SUMS may vouch for an installed library without
+# asking the server. Releases can be re-published (`gh release upload
+# --clobber`), so older copies are revalidated with their ETag.
+_SHA256SUMS_MAX_AGE = 7 * 24 * 60 * 60
+
+# Set by main to abandon a background download (checked between chunks).
+_CANCEL_DOWNLOAD = threading.Event()
+
+
+class _DownloadCancelled(BaseException):
+  # A BaseException so the `except Exception` fallbacks in _fetch_asset do not
+  # retry, or hand to `gh`, a download that is being abandoned.
+  pass
+
+
+def _check_cancelled() -> None:
+  if _CANCEL_DOWNLOAD.is_set():
+    raise _DownloadCancelled()
+
 
 def _die(msg: str, code: int = 1) -> "None":
   print(f"wgpu-mbt: {msg}", file=sys.stderr)
   raise SystemExit(code)
 
 
+@lru_cache(maxsize=1)
 def _module_version() -> str:
   root = Path(__file__).resolve().parents[1]
   mod = root / "moon.mod.json"
   try:
-    data = json.loads(mod.read_text(encoding="utf-8"))
+    data = json.loads(mod.read_bytes())
   except Exception as e:
     _die(f"failed to read moon.mod.json: {e}")
   ver = data.get("version")
@@ -44,71 +79,169 @@ def _module_version() -> str:
   return ver
 
 
+# Prebuilt release assets: (platform, arch) -> (asset_name, default_filename).
+# We currently publish darwin-arm64-metal, linux-amd64-vulkan and windows-amd64-dx12.
+_ASSETS: dict[tuple[str, str], tuple[str, str]] = {
+  ("darwin", "arm64"): ("libwgpu_native-darwin-arm64-metal.dylib", "libwgpu_native.dylib"),
+  ("linux", "amd64"): ("libwgpu_native-linux-amd64-vulkan.so", "libwgpu_native.so"),
+  ("win32", "amd64"): ("wgpu_native-windows-amd64-dx12.dll", "wgpu_native.dll"),
+}
+_ARCH_ALIASES = {"aarch64": "arm64", "x86_64": "amd64"}
+_PLATFORM_NAMES = {"darwin": "macOS", "linux": "linux", "win32": "windows"}
+
+
 def _platform_asset() -> tuple[str, str]:
   # Returns: (asset_name, default_filename)
-  sp = sys.platform
+  sp = "linux" if sys.platform.startswith("linux") else sys.platform
   arch = platform.machine().lower()
+  asset = _ASSETS.get((sp, _ARCH_ALIASES.get(arch, arch)))
+  if asset is not None:
+    return asset
+  if sp not in _PLATFORM_NAMES:
+    _die(f"unsupported platform: {sys.platform}")
+  supported = next(a for p, a in _ASSETS if p == sp)
+  _die(f"unsupported {_PLATFORM_NAMES[sp]} arch: {arch} (only {supported} is supported by prebuilt assets)")
 
-  if sp == "darwin":
-    # We currently publish darwin-arm64-metal.
-    if arch not in ("arm64", "aarch64"):
-      _die(f"unsupported macOS arch: {arch} (only arm64 is supported by prebuilt assets)")
-    return ("libwgpu_native-darwin-arm64-metal.dylib", "libwgpu_native.dylib")
-
-  if sp.startswith("linux"):
-    if arch not in ("x86_64", "amd64"):
-      _die(f"unsupported linux arch: {arch} (only amd64 is supported by prebuilt assets)")
-    return ("libwgpu_native-linux-amd64-vulkan.so", "libwgpu_native.so")
-
-  if sp == "win32":
-    if arch not in ("amd64", "x86_64"):
-      _die(f"unsupported windows arch: {arch} (only amd64 is supported by prebuilt assets)")
-    return ("wgpu_native-windows-amd64-dx12.dll", "wgpu_native.dll")
 
-  _die(f"unsupported platform: {sp}")
-
-
-def _default_install_path(default_filename: str) -> Path:
+@lru_cache(maxsize=1)
+def _home() -> Path:
   home = os.environ.get("HOME") or os.environ.get("USERPROFILE") or str(Path.home())
   if not home:
     _die("HOME/USERPROFILE is not set")
-  dst_dir = Path(home) / ".local" / "lib"
-  dst_dir.mkdir(parents=True, exist_ok=True)
+  return Path(home)
+
+
+def _default_install_path(default_filename: str) -> Path:
+  dst_dir = _home() / ".local" / "lib"
+  # Only issue the mkdir when needed; on network homes each one is a round-trip.
+  if not dst_dir.is_dir():
+    dst_dir.mkdir(parents=True, exist_ok=True)
   return dst_dir / default_filename
 
 
 def _default_data_dir() -> Path:
-  home = os.environ.get("HOME") or os.environ.get("USERPROFILE") or str(Path.home())
-  if not home:
-    _die("HOME/USERPROFILE is not set")
   if os.name == "nt":
-    base = Path(home) / ".local" / "share"
+    base = _home() / ".local" / "share"
   else:
     xdg = os.environ.get("XDG_DATA_HOME", "")
-    base = Path(xdg) if xdg else (Path(home) / ".local" / "share")
+    base = Path(xdg) if xdg else (_home() / ".local" / "share")
   d = base / "wgpu_mbt"
-  d.mkdir(parents=True, exist_ok=True)
+  if not d.is_dir():
+    d.mkdir(parents=True, exist_ok=True)
   return d
 
 
-def _download(url: str, dst: Path) -> None:
-  req = urllib.request.Request(url, headers={"User-Agent": "wgpu-mbt postadd"})
-  with urllib.request.urlopen(req, timeout=60) as r:
+def _partial_path(dst: Path) -> Path:
+  return dst.with_name(dst.name + ".partial")
+
+
+def _partial_validator_path(dst: Path) -> Path:
+  # ETag (or Last-Modified) of the response a partial download started from.
+  return dst.with_name(dst.name + ".partial.validator")
+
+
+def _drop_partial(dst: Path) -> None:
+  _partial_path(dst).unlink(missing_ok=True)
+  _partial_validator_path(dst).unlink(missing_ok=True)
+
+
+def _response_validator(r) -> str | None:
+  # If-Range only accepts a strong ETag; fall back to Last-Modified.
+  etag = r.headers.get("ETag")
+  if etag and not etag.startswith("W/"):
+    return etag
+  return r.headers.get("Last-Modified")
+
+
+def _download(url: str, dst: Path) -> str:
+  # Returns the sha256 hex digest of the downloaded bytes, hashed as they arrive
+  # so the file does not have to be read back afterwards.
+  #
+  # Bytes land in `<dst>.partial` next to `dst` (so the final replace is a
+  # same-filesystem rename). A partial file left by an interrupted run is
+  # resumed with a Range request instead of starting over.
+  _check_cancelled()
+  part = _partial_path(dst)
+  validator_file = _partial_validator_path(dst)
+  h = hashlib.sha256()
+  offset = 0
+  validator = None
+  if part.exists():
+    try:
+      validator = validator_file.read_text(encoding="utf-8").strip() or None
+    except OSError:
+      pass
+    if validator is None:
+      # Releases can be re-uploaded under the same tag; without a validator
+      # there is no telling whether the kept bytes belong to this asset.
+      _drop_partial(dst)
+    else:
+      # hashlib state cannot be saved across runs; rehash the kept prefix once.
+      with part.open("rb") as f:
+        for chunk in iter(lambda: f.read(_DL_CHUNK), b""):
+          h.update(chunk)
+        offset = f.tell()
+
+  headers = {"User-Agent": "wgpu-mbt postadd"}
+  if offset:
+    headers["Range"] = f"bytes={offset}-"
+    # The server only honors the range while the asset is unchanged; otherwise
+    # it sends the whole current asset with a 200.
+    headers["If-Range"] = validator
+  req = urllib.request.Request(url, headers=headers)
+  try:
+    r = urllib.request.urlopen(req, timeout=60)
+  except urllib.error.HTTPError as e:
+    if e.code != 416 or not offset:
+      raise
+    # The kept prefix is not a prefix of this asset (e.g. it is already longer).
+    _drop_partial(dst)
+    return _download(url, dst)
+  with r:
     if getattr(r, "status", 200) >= 400:
       _die(f"download failed: {url} (HTTP {r.status})")
-    with tempfile.NamedTemporaryFile(delete=False) as f:
-      tmp = Path(f.name)
+    if offset and r.status == 206:
+      if not r.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+        # Not the range we asked for; start over.
+        _drop_partial(dst)
+        return _download(url, dst)
+      mode = "ab"
+    else:
+      # A fresh download, or the server sent the whole asset (range ignored,
+      # or the asset changed since the partial was started).
+      h = hashlib.sha256()
+      mode = "wb"
+      v = _response_validator(r)
+      if v:
+        validator_file.write_text(v, encoding="utf-8")
+      else:
+        validator_file.unlink(missing_ok=True)
+    with part.open(mode) as f:
       while True:
-        chunk = r.read(1024 * 256)
+        _check_cancelled()
+        chunk = r.read(_DL_CHUNK)
         if not chunk:
           break
+        h.update(chunk)
         f.write(chunk)
-  tmp.replace(dst)
+      f.flush()
+      os.fsync(f.fileno())
+    # http.client treats an early EOF as the end of the body; keep what arrived
+    # so the next run can resume it.
+    if getattr(r, "length", None):
+      raise OSError(f"download truncated: {url} ({r.length} bytes missing)")
+  part.replace(dst)
+  validator_file.unlink(missing_ok=True)
+  return h.hexdigest()
 
 
-def _download_via_gh(tag: str, asset_name: str, dst: Path) -> None:
+def _download_via_gh(tag: str, asset_name: str, dst: Path) -> str:
+  # Returns the sha256 hex digest of the downloaded file.
   # Works for both public and private repos as long as `gh auth login` is done.
-  with tempfile.TemporaryDirectory() as td:
+  _check_cancelled()
+  # The scratch dir sits next to `dst` so the final replace is a same-filesystem
+  # rename ($TMPDIR is often a different mount, where os.replace would fail).
+  with tempfile.TemporaryDirectory(dir=dst.parent, prefix=".gh-") as td:
     d = Path(td)
     cmd = ["gh", "release", "download", "-R", REPO, tag, "-p", asset_name, "-D", str(d)]
     p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
@@ -120,60 +253,223 @@ def _download_via_gh(tag: str, asset_name: str, dst: Path) -> None:
     src = d / asset_name
     if not src.exists():
       _die(f"gh download succeeded but file missing: {src}")
+    digest = _sha256(src)
     src.replace(dst)
+  return digest
 
 
-def _sha256(path: Path) -> str:
+@lru_cache(maxsize=1)
+def _zstd_reader():
+  # Returns a callable wrapping a binary file in a decompressing reader, or None
+  # when neither the stdlib module (Python 3.14+) nor `zstandard` is available.
+  try:
+    from compression import zstd  # type: ignore[import-not-found]
+
+    return zstd.ZstdFile
+  except ImportError:
+    pass
+  try:
+    import zstandard  # type: ignore[import-not-found]
+  except ImportError:
+    return None
+  return zstandard.ZstdDecompressor().stream_reader
+
+
+def _unpack_zst(open_zst, src: Path, dst: Path) -> str:
+  # Returns the sha256 hex digest of the decompressed bytes, which is what
+  # SHA256SUMS lists for the plain asset.
   h = hashlib.sha256()
-  with path.open("rb") as f:
-    for chunk in iter(lambda: f.read(1024 * 256), b""):
+  with src.open("rb") as fin, open_zst(fin) as r, dst.open("wb") as f:
+    for chunk in iter(lambda: r.read(_DL_CHUNK), b""):
+      _check_cancelled()
       h.update(chunk)
+      f.write(chunk)
+    f.flush()
+    os.fsync(f.fileno())
+  src.unlink()
   return h.hexdigest()
 
 
-def _expected_sha256(version: str, asset_name: str) -> str:
-  tag = f"v{version}"
+def _packed_path(dst: Path) -> Path:
+  return dst.with_name(dst.name + ".zst")
+
+
+def _discard_download(dst: Path) -> None:
+  # Best-effort removal of everything _fetch_asset may have left for `dst`.
+  for p in (dst, _packed_path(dst)):
+    try:
+      p.unlink(missing_ok=True)
+      _drop_partial(p)
+    except OSError:
+      pass
+
+
+def _fetch_asset(url: str, tag: str, asset_name: str, dst: Path) -> str:
+  # Returns the sha256 hex digest of the installed asset.
+  packed = _packed_path(dst)
+  try:
+    # Releases also carry a zstd-compressed `<asset>.zst` (~3-4x smaller); use it
+    # when we can decompress it.
+    open_zst = _zstd_reader()
+    if open_zst is not None:
+      try:
+        _download(url + ".zst", packed)
+        return _unpack_zst(open_zst, packed, dst)
+      except Exception:
+        # Older releases have no .zst (private repos 404 here too); any other
+        # failure, including a corrupt resumed .zst, gets the plain asset too.
+        packed.unlink(missing_ok=True)
+        _drop_partial(packed)
+    return _download(url, dst)
+  except Exception:
+    # Private repos (or restricted assets) typically return 404 without auth. Fall back to `gh`.
+    got = _download_via_gh(tag, asset_name, dst)
+    _drop_partial(dst)
+    _drop_partial(packed)
+    return got
+
+
+def _sha256(path: Path) -> str:
+  with path.open("rb", buffering=0) as f:
+    if sys.version_info >= (3, 11):
+      # Reads into a reusable buffer in C, without per-chunk bytes objects.
+      return hashlib.file_digest(f, "sha256").hexdigest()
+    h = hashlib.sha256()
+    for chunk in iter(lambda: f.read(_DL_CHUNK), b""):
+      h.update(chunk)
+    return h.hexdigest()
+
+
+def _sha256sums_cache(data_dir: Path, tag: str) -> tuple[Path, Path]:
+  # Returns: (cached SHA256SUMS, its ETag)
+  return (data_dir / f"SHA256SUMS-{tag}", data_dir / f"SHA256SUMS-{tag}.etag")
+
+
+def _cached_sha256sums(data_dir: Path, tag: str, max_age: float | None = None) -> str | None:
+  # With `max_age` (seconds), a copy last confirmed longer ago counts as missing.
+  cache, _ = _sha256sums_cache(data_dir, tag)
+  try:
+    if max_age is not None and time.time() - cache.stat().st_mtime > max_age:
+      return None
+    return cache.read_text(encoding="utf-8", errors="replace")
+  except OSError:
+    return None
+
+
+def _fetch_sha256sums(data_dir: Path, tag: str) -> str:
+  cache, etag_file = _sha256sums_cache(data_dir, tag)
   url = f"https://github.com/{REPO}/releases/download/{tag}/SHA256SUMS"
+  headers = {"User-Agent": "wgpu-mbt postadd"}
+  cached = _cached_sha256sums(data_dir, tag)
+  if cached is not None and etag_file.exists():
+    headers["If-None-Match"] = etag_file.read_text(encoding="utf-8").strip()
+  etag = None
   try:
-    req = urllib.request.Request(url, headers={"User-Agent": "wgpu-mbt postadd"})
+    req = urllib.request.Request(url, headers=headers)
     with urllib.request.urlopen(req, timeout=60) as r:
       txt = r.read().decode("utf-8", errors="replace")
+      etag = r.headers.get("ETag")
+  except urllib.error.HTTPError as e:
+    if e.code == 304 and cached is not None:
+      # Still current: restart its max-age window.
+      try:
+        os.utime(cache)
+      except OSError:
+        pass
+      return cached
+    txt = _fetch_sha256sums_via_gh(tag)
   except Exception:
-    # Private repos (or restricted assets) typically return 404 without auth. Fall back to `gh`.
-    with tempfile.TemporaryDirectory() as td:
-      tmp = Path(td) / "SHA256SUMS"
-      _download_via_gh(tag, "SHA256SUMS", tmp)
-      txt = tmp.read_text(encoding="utf-8", errors="replace")
+    txt = _fetch_sha256sums_via_gh(tag)
+  cache.write_text(txt, encoding="utf-8")
+  if etag:
+    etag_file.write_text(etag, encoding="utf-8")
+  else:
+    etag_file.unlink(missing_ok=True)  # type: ignore[arg-type]
+  return txt
+
+
+def _fetch_sha256sums_via_gh(tag: str) -> str:
+  # Private repos (or restricted assets) typically return 404 without auth. Fall back to `gh`.
+  with tempfile.TemporaryDirectory() as td:
+    tmp = Path(td) / "SHA256SUMS"
+    _download_via_gh(tag, "SHA256SUMS", tmp)
+    return tmp.read_text(encoding="utf-8", errors="replace")
+
+
+@lru_cache(maxsize=4)
+def _parse_sha256sums(txt: str) -> dict[str, str]:
+  # Returns: {filename: hex}; the first entry wins for duplicated names.
+  sums: dict[str, str] = {}
   for line in txt.splitlines():
     # format: "<hex>  <filename>"
-    parts = line.strip().split()
-    if len(parts) >= 2 and parts[-1] == asset_name:
-      return parts[0]
-  _die(f"SHA256SUMS does not contain {asset_name} (tag {tag})")
+    parts = line.split()
+    if len(parts) >= 2:
+      sums.setdefault(parts[-1], parts[0])
+  return sums
+
 
+def _expected_sha256(data_dir: Path, tag: str, asset_name: str) -> str:
+  got = _parse_sha256sums(_fetch_sha256sums(data_dir, tag)).get(asset_name)
+  if got is None:
+    _die(f"SHA256SUMS does not contain {asset_name} (tag {tag})")
+  return got
 
-def _run_moon_probe(root: Path, pkg_path: str, env: dict[str, str]) -> bool:
+
+def _start_moon_probe(root: Path, pkg_path: str, env: dict[str, str]) -> tuple[subprocess.Popen[bytes], IO[bytes]]:
+  # Raises FileNotFoundError when `moon` is not installed.
+  #
+  # Output goes to an unlinked temp file rather than a pipe: it is only read back
+  # when the probe fails, and concurrent probes cannot stall on a full pipe
+  # buffer while we wait on another one.
   cmd = ["moon", "run", pkg_path, "--target", "native"]
+  out = tempfile.TemporaryFile()
   try:
-    p = subprocess.run(cmd, cwd=root, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-  except FileNotFoundError:
-    print("wgpu-mbt: 'moon' not found; skipping feature probes")
-    return False
-  if p.returncode == 0:
-    return True
-  out = (p.stdout or "").strip()
-  if out:
-    print(f"wgpu-mbt: probe failed ({pkg_path}); leaving feature disabled.\n{out}")
+    p = subprocess.Popen(cmd, cwd=root, env=env, stdout=out, stderr=subprocess.STDOUT)
+  except BaseException:
+    out.close()
+    raise
+  return p, out
+
+
+def _finish_moon_probe(probe: tuple[subprocess.Popen[bytes], IO[bytes]], pkg_path: str) -> bool:
+  p, out = probe
+  with out:
+    if p.wait() == 0:
+      return True
+    out.seek(0)
+    text = out.read().decode("utf-8", errors="replace").strip()
+  if text:
+    print(f"wgpu-mbt: probe failed ({pkg_path}); leaving feature disabled.\n{text}")
   else:
     print(f"wgpu-mbt: probe failed ({pkg_path}); leaving feature disabled.")
   return False
 
 
-def _auto_probe_and_write_markers(lib_path: Path) -> None:
+def _marker_is_current(marker: Path, text: str) -> bool:
+  try:
+    return marker.read_text(encoding="utf-8") == text
+  except OSError:
+    return False
+
+
+def _auto_probe_and_write_markers(lib_path: Path, d: Path, lib_sha256: str | None = None) -> None:
+  # `d` is the data dir the markers live in.
   root = Path(__file__).resolve().parents[1]
-  d = _default_data_dir()
-  m_pipeline = d / MARKER_PIPELINE_ASYNC
-  m_comp = d / MARKER_COMPILATION_INFO
+
+  # The native side only reads the first line (`lib_path=`); the digest and
+  # module version let us skip probes that already passed for this exact
+  # library and probe code.
+  if lib_sha256 is None:
+    lib_sha256 = _sha256(lib_path)
+  marker_text = f"lib_path={lib_path}\nsha256={lib_sha256.lower()}\nversion={_module_version()}\n"
+  pending = [
+    (pkg_path, d / marker)
+    for pkg_path, marker in _PROBES
+    if not _marker_is_current(d / marker, marker_text)
+  ]
+  if not pending:
+    print(f"wgpu-mbt: feature markers under {d} are up to date")
+    return
 
   env = dict(os.environ)
   env["MBT_WGPU_NATIVE_LIB"] = str(lib_path)
@@ -182,28 +478,36 @@ def _auto_probe_and_write_markers(lib_path: Path) -> None:
   env["MBT_WGPU_ENABLE_PIPELINE_ASYNC"] = "1"
   env["MBT_WGPU_ENABLE_COMPILATION_INFO"] = "1"
 
-  ok_pipeline = _run_moon_probe(root, "src/cmd/probe_pipeline_async", env)
-  if ok_pipeline:
-    m_pipeline.write_text(f"lib_path={lib_path}\n", encoding="utf-8")
-  else:
-    m_pipeline.unlink(missing_ok=True)  # type: ignore[arg-type]
+  # Each probe stays its own process (a failing probe may crash outright), but
+  # they run concurrently so their `moon run` startup costs overlap.
+  procs: list[tuple[subprocess.Popen[bytes], IO[bytes]]] = []
+  try:
+    for pkg_path, _ in pending:
+      procs.append(_start_moon_probe(root, pkg_path, env))
+  except FileNotFoundError:
+    print("wgpu-mbt: 'moon' not found; skipping feature probes")
 
-  ok_comp = _run_moon_probe(root, "src/cmd/probe_compilation_info", env)
-  if ok_comp:
-    m_comp.write_text(f"lib_path={lib_path}\n", encoding="utf-8")
-  else:
-    m_comp.unlink(missing_ok=True)  # type: ignore[arg-type]
+  any_ok = False
+  for i, (pkg_path, m) in enumerate(pending):
+    ok = i < len(procs) and _finish_moon_probe(procs[i], pkg_path)
+    if ok:
+      m.write_text(marker_text, encoding="utf-8")
+      any_ok = True
+    else:
+      m.unlink(missing_ok=True)  # type: ignore[arg-type]
 
-  if ok_pipeline or ok_comp:
+  if any_ok:
     print(f"wgpu-mbt: wrote feature markers under {d}")
 
 
 def main() -> None:
+  # Resolved once here and passed down; both touch the filesystem.
+  data_dir = _default_data_dir()
   override = os.environ.get("MBT_WGPU_NATIVE_LIB", "")
   if override and Path(override).exists():
     lib_path = Path(override)
     print(f"wgpu-mbt: MBT_WGPU_NATIVE_LIB is already set -> {lib_path}")
-    _auto_probe_and_write_markers(lib_path)
+    _auto_probe_and_write_markers(lib_path, data_dir)
     return
 
   version = _module_version()
@@ -213,29 +517,64 @@ def main() -> None:
   tag = f"v{version}"
   url = f"https://github.com/{REPO}/releases/download/{tag}/{asset_name}"
 
-  try:
-    expected = _expected_sha256(version, asset_name)
-  except Exception as e:
-    _die(str(e))
+  # A recently confirmed SHA256SUMS copy from a previous run lets an
+  # already-installed, matching library skip the network entirely. The
+  # trade-off: a release re-published within that window is not noticed
+  # until the copy ages out.
+  installed = _sha256(dst).lower() if dst.exists() else None
+  cached = _cached_sha256sums(data_dir, tag, max_age=_SHA256SUMS_MAX_AGE)
+  expected = _parse_sha256sums(cached).get(asset_name) if cached is not None else None
+  # Downloads land in a staging file next to `dst` and only replace it once
+  # their digest matches, so `dst` is never observed with unverified bytes.
+  # The tag in the name keeps a resumable partial download of one release from
+  # being continued with another release's bytes.
+  staged = dst.with_name(f".{dst.name}.{tag}.download")
+  got = None
+  if installed is None:
+    # Nothing to compare against, so the asset is needed either way: fetch it
+    # while SHA256SUMS is still in flight. The download runs on a daemon thread
+    # (not an executor, whose workers are joined at exit) so a failed SHA256SUMS
+    # lookup can exit right away instead of waiting for the whole library.
+    asset: Future[str] = Future()
+
+    def fetch() -> None:
+      try:
+        asset.set_result(_fetch_asset(url, tag, asset_name, staged))
+      except BaseException as e:
+        asset.set_exception(e)
+
+    fetcher = threading.Thread(target=fetch, daemon=True)
+    fetcher.start()
+    try:
+      expected = _expected_sha256(data_dir, tag, asset_name)
+    except BaseException as e:
+      # Stop the download at its next chunk and let it unwind (closing its
+      # files) before removing them, so it cannot recreate what we delete.
+      # A stalled read or a running `gh` may outlast the short wait.
+      _CANCEL_DOWNLOAD.set()
+      fetcher.join(timeout=2)
+      _discard_download(staged)
+      if isinstance(e, Exception):
+        _die(str(e))
+      raise
+    got = asset.result()
+  elif expected is None or installed != expected.lower():
+    try:
+      expected = _expected_sha256(data_dir, tag, asset_name)
+    except Exception as e:
+      _die(str(e))
 
-  # If already installed and matches, keep it.
-  if dst.exists():
-    got = _sha256(dst)
-    if got.lower() == expected.lower():
+  if got is None:
+    # If already installed and matches, keep it.
+    if installed == expected.lower():
       print(f"wgpu-mbt: libwgpu_native already installed -> {dst}")
-      _auto_probe_and_write_markers(dst)
+      _auto_probe_and_write_markers(dst, data_dir, installed)
       return
+    got = _fetch_asset(url, tag, asset_name, staged)
 
-  try:
-    _download(url, dst)
-  except Exception:
-    # Private repos (or restricted assets) typically return 404 without auth. Fall back to `gh`.
-    _download_via_gh(tag, asset_name, dst)
-
-  got = _sha256(dst)
   if got.lower() != expected.lower():
     try:
-      dst.unlink(missing_ok=True)  # type: ignore[arg-type]
+      staged.unlink(missing_ok=True)  # type: ignore[arg-type]
     except Exception:
       pass
     _die(f"sha256 mismatch for {dst} (expected {expected}, got {got})")
@@ -243,13 +582,14 @@ def main() -> None:
   # Make executable bit on unix.
   if os.name != "nt":
     try:
-      dst.chmod(dst.stat().st_mode | 0o111)
+      staged.chmod(staged.stat().st_mode | 0o111)
     except Exception:
       pass
+  os.replace(staged, dst)
 
   print(f"wgpu-mbt: installed libwgpu_native -> {dst}")
   print(f"wgpu-mbt: tip: you can override with MBT_WGPU_NATIVE_LIB={dst}")
-  _auto_probe_and_write_markers(dst)
+  _auto_probe_and_write_markers(dst, data_dir, got)
 
 
 if __name__ == "__main__":